@@ -0,0 +1,143 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+
+class LocalTokenCache:
+    """LRU в памяти процесса с ограниченным временем жизни записей."""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SharedTokenCache:
+    """Общий для всех процессов кеш Django (например, Redis)."""
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, value):
+        caches[self.alias].set(key, value, self.timeout)
+
+    def delete(self, key):
+        caches[self.alias].delete(key)
+
+    def clear(self):
+        # Записи общего кеша истекают сами, чистить его целиком нельзя.
+        pass
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    with _token_cache_lock:
+        if _token_cache is None:
+            timeout = settings.TOKEN_AUTH_CACHE_TIMEOUT
+            if settings.TOKEN_AUTH_CACHE_ALIAS:
+                _token_cache = SharedTokenCache(
+                    settings.TOKEN_AUTH_CACHE_ALIAS, timeout
+                )
+            else:
+                _token_cache = LocalTokenCache(
+                    settings.TOKEN_AUTH_CACHE_SIZE, timeout
+                )
+        return _token_cache
+
+
+def reset_token_cache():
+    global _token_cache
+    with _token_cache_lock:
+        if _token_cache is not None:
+            _token_cache.clear()
+        _token_cache = None
+
+
+def get_cache_key(key):
+    # Сам токен в ключ кеша не попадает.
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_tokens(keys):
+    cache = get_token_cache()
+    for key in keys:
+        cache.delete(get_cache_key(key))
+
+
+# Пароль и счётчики в кеш не попадают: у восстановленного пользователя
+# это отложенные поля, они читаются из БД только при обращении и не
+# перезаписываются его save().
+SNAPSHOT_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.name != 'password' and field.name not in User.COUNTER_FIELDS
+]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, запоминающий пользователя токена.
+
+    Повторный запрос с тем же токеном не обращается к БД: пользователь
+    собирается из сохранённых полей. Запись удаляется при удалении токена
+    и при сохранении пользователя (api.signals); изменения через
+    QuerySet.update() без сигналов видны не позже TOKEN_AUTH_CACHE_TIMEOUT.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = get_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, (
+                [getattr(user, name) for name in SNAPSHOT_FIELDS],
+                token.created
+            ))
+            return user, token
+        values, created = cached
+        user = User.from_db(router.db_for_read(User), SNAPSHOT_FIELDS, values)
+        return user, Token(key=key, user=user, created=created)
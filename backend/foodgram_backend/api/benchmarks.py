@@ -0,0 +1,127 @@
+import base64
+import io
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from users.models import User
+
+BENCHMARK_HOST = 'localhost'
+
+
+def get_client(user=None):
+    client = APIClient(HTTP_HOST=BENCHMARK_HOST)
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = round(percent / 100 * (len(ordered) - 1))
+    return ordered[index]
+
+
+def measure_requests(client, requests, allocations=True):
+    """Выполняет запросы (method, url, data) по очереди.
+
+    Последний запрос, если allocations включён, выполняется под
+    tracemalloc и в задержки не попадает.
+    """
+    timings = []
+    statuses = set()
+    queries = 0
+    peak = None
+    for index, (method, url, data) in enumerate(requests):
+        traced = allocations and index == len(requests) - 1 and index > 0
+        if traced:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - start) * 1000
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            timings.append(elapsed)
+        queries = len(context.captured_queries)
+        statuses.add(response.status_code)
+    result = {
+        'url': requests[0][1],
+        'status': '/'.join(str(status) for status in sorted(statuses)),
+        'queries': queries,
+        'p50': statistics.median(timings),
+        'p95': percentile(timings, 95),
+    }
+    if peak is not None:
+        result['peak_kb'] = peak / 1024
+    return result
+
+
+def measure(client, url, repeat=10, method='get', data=None):
+    return measure_requests(client, [(method, url, data)] * repeat,
+                            allocations=False)
+
+
+def make_image_data(size=(2, 2)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def create_recipes(count, ingredients_per_recipe=8, tags_per_recipe=3,
+                   authors=10):
+    users = User.objects.bulk_create([
+        User(username=f'bench_author_{i}',
+             email=f'bench_author_{i}@example.com')
+        for i in range(authors)
+    ])
+    tags = Tag.objects.bulk_create([
+        Tag(name=f'bench tag {i}', color='#000000', slug=f'bench-tag-{i}')
+        for i in range(tags_per_recipe * 2)
+    ])
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(name=f'bench ingredient {i}', measurement_unit='г')
+        for i in range(ingredients_per_recipe * 4)
+    ])
+    recipes = Recipe.objects.bulk_create([
+        Recipe(author=users[i % authors], name=f'bench recipe {i}',
+               text='bench', cooking_time=10)
+        for i in range(count)
+    ])
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe.pk,
+                            tag_id=tags[(i + j) % len(tags)].pk)
+        for i, recipe in enumerate(recipes)
+        for j in range(tags_per_recipe)
+    ])
+    IngredientsInRecipe.objects.bulk_create([
+        IngredientsInRecipe(
+            recipe=recipe,
+            ingredient=ingredients[(i + j) % len(ingredients)],
+            amount=j + 1
+        )
+        for i, recipe in enumerate(recipes)
+        for j in range(ingredients_per_recipe)
+    ])
+    return users, recipes
+
+
+def format_row(name, result):
+    row = (f'{name:<40} status={result["status"]} '
+           f'queries={result["queries"]:<4} '
+           f'p50={result["p50"]:.1f}ms p95={result["p95"]:.1f}ms')
+    if 'peak_kb' in result:
+        row += f' alloc={result["peak_kb"]:.0f}KB'
+    return row
@@ -0,0 +1,132 @@
+import base64
+import binascii
+import io
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо.
+DECODE_CHUNK_SIZE = 64 * 1024
+HEADER_PROBE_SIZE = 64 * 1024
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    data_uri_regex = re.compile(
+        r'^data:image/(?P<format>[a-z0-9.+-]+);base64,', re.IGNORECASE
+    )
+    whitespace_regex = re.compile(r'\s+')
+    default_error_messages = {
+        'invalid_data_uri': 'Ожидается картинка в формате data URI base64.',
+        'invalid_base64': 'Некорректные данные base64.',
+        'invalid_format': 'Недопустимый формат картинки: {format}.',
+        'too_large': 'Размер картинки больше {max_bytes} байт.',
+        'too_many_pixels': ('Картинка больше {max_pixels} пикселей '
+                            '({width}x{height}).'),
+        'decompression_bomb': 'Картинка больше {max_pixels} пикселей.',
+    }
+
+    def __init__(self, max_bytes=None, max_pixels=None, formats=None,
+                 **kwargs):
+        if max_bytes is None:
+            max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+        if max_pixels is None:
+            max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if formats is None:
+            formats = settings.RECIPE_IMAGE_FORMATS
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.formats = formats
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            raise SkipField()
+        if not isinstance(data, str):
+            return super().to_internal_value(data)
+        match = self.data_uri_regex.match(data)
+        if match is None:
+            self.fail('invalid_data_uri')
+        declared_format = match.group('format').upper()
+        if declared_format == 'JPG':
+            declared_format = 'JPEG'
+        if declared_format not in self.formats:
+            self.fail('invalid_format', format=declared_format)
+        start = match.end()
+        # Клиенты переносят base64 по строкам; без пробельных символов
+        # куски для декодирования остаются кратными 4.
+        if self.whitespace_regex.search(data, start):
+            data = self.whitespace_regex.sub('', data)
+        self.validate_size(data, start)
+        probe = data[start:start + HEADER_PROBE_SIZE]
+        probe = probe[:len(probe) - len(probe) % 4]
+        header = self.read_header(io.BytesIO(self.decode(probe)))
+        if header is not None:
+            self.validate_header(*header)
+            file = self.decode_to_file(data, start, header[0])
+        else:
+            # Заголовок не поместился в пробный кусок (например, большой
+            # EXIF): проверяем его уже по файлу на диске.
+            file = self.decode_to_file(data, start, declared_format)
+            header = self.read_header(file)
+            if header is None:
+                self.fail('invalid_image')
+            self.validate_header(*header)
+            file.seek(0)
+        return super().to_internal_value(file)
+
+    def validate_size(self, data, start):
+        padding = len(data) - len(data.rstrip('='))
+        decoded_size = (len(data) - start) * 3 // 4 - padding
+        if decoded_size > self.max_bytes:
+            self.fail('too_large', max_bytes=self.max_bytes)
+
+    def read_header(self, file):
+        try:
+            with Image.open(file) as image:
+                return image.format, image.size
+        except Image.DecompressionBombError:
+            # Pillow отказывается открывать такие картинки сам, размеры
+            # из заголовка тогда недоступны.
+            raise serializers.ValidationError(
+                self.error_messages['decompression_bomb'].format(
+                    max_pixels=self.max_pixels
+                ),
+                code='too_many_pixels'
+            )
+        except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+            return None
+
+    def validate_header(self, image_format, size):
+        width, height = size
+        if image_format not in self.formats:
+            self.fail('invalid_format', format=image_format)
+        if width * height > self.max_pixels:
+            self.fail('too_many_pixels', max_pixels=self.max_pixels,
+                      width=width, height=height)
+
+    def decode(self, chunk):
+        try:
+            return base64.b64decode(chunk, validate=True)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+
+    def decode_to_file(self, data, start, image_format):
+        extension = EXTENSIONS.get(image_format, image_format.lower())
+        file = TemporaryUploadedFile(
+            name=f'{uuid.uuid4()}.{extension}',
+            content_type=Image.MIME.get(image_format),
+            size=0,
+            charset=None
+        )
+        for position in range(start, len(data), DECODE_CHUNK_SIZE):
+            file.write(self.decode(data[position:position
+                                        + DECODE_CHUNK_SIZE]))
+        file.size = file.tell()
+        file.seek(0)
+        return file
@@ -1,13 +1,40 @@
-from django_filters.rest_framework import (BooleanFilter, FilterSet,
-                                           ModelMultipleChoiceFilter)
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef
+from django_filters.rest_framework import (BooleanFilter, ChoiceFilter,
+                                           FilterSet, MultipleChoiceFilter)
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
 from recipes.models import Recipe, Tag
+from services import catalog_cache, ingredient_search, recipe_scores
+
+
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+
+
+def get_tag_ids_by_slug():
+    return catalog_cache.get_or_build(
+        'tags', None,
+        lambda: dict(Tag.objects.values_list('slug', 'id')),
+        name='slug_map'
+    )['data']
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids_by_slug()]
 
 
 class RecipeFilter(FilterSet):
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='tags_filter'
+    )
+    tags_mode = ChoiceFilter(
+        choices=((TAGS_MODE_ANY, 'Любой из тегов'),
+                 (TAGS_MODE_ALL, 'Все теги')),
+        method='tags_mode_filter'
     )
     is_favorited = BooleanFilter(
         method='is_favorited_filter'
@@ -15,11 +42,32 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
+    ordering = ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='ordering_filter'
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def tags_filter(self, queryset, name, value):
+        tag_ids = {get_tag_ids_by_slug()[slug] for slug in value}
+        recipe_tags = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_mode') == TAGS_MODE_ALL:
+            return queryset.filter(pk__in=recipe_tags.values(
+                'recipe_id'
+            ).annotate(
+                matched=Count('tag_id')
+            ).filter(matched=len(tag_ids)).values('recipe_id'))
+        return queryset.filter(
+            Exists(recipe_tags.filter(recipe_id=OuterRef('pk')))
+        )
+
+    def tags_mode_filter(self, queryset, name, value):
+        # Режим учитывается в tags_filter.
+        return queryset
+
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
@@ -31,3 +79,27 @@ class RecipeFilter(FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(recipe_in_shopping_cart__user=user)
         return queryset
+
+    def ordering_filter(self, queryset, name, value):
+        return recipe_scores.order_by_popularity(queryset)
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+    limit_param = 'limit'
+
+    def get_limit(self, request):
+        limit = request.query_params.get(self.limit_param)
+        if limit is None:
+            return settings.INGREDIENT_SEARCH_LIMIT
+        if not limit.isdigit() or int(limit) == 0:
+            raise ValidationError(
+                {self.limit_param: ['Должно быть положительным числом']}
+            )
+        return min(int(limit), settings.INGREDIENT_SEARCH_MAX_LIMIT)
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(api_settings.SEARCH_PARAM, '')
+        query = query.strip()
+        if not query:
+            return queryset
+        return ingredient_search.search(query, self.get_limit(request))
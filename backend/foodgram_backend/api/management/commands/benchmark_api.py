@@ -0,0 +1,212 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+
+from api.benchmarks import (format_row, get_client, make_image_data,
+                            measure_requests)
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscribe, User
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет все действия API на текущей базе (см. seed_foodgram) '
+            'и выводит число запросов, p50/p95 и пик выделенной памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--only', nargs='+', metavar='NAME',
+                            help='запустить только сценарии с этими '
+                                 'префиксами')
+        parser.add_argument('--output', type=Path,
+                            help='сохранить результат в JSON')
+        parser.add_argument('--compare', type=Path,
+                            help='сравнить с сохранённым JSON')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        user = User.objects.filter(
+            shopping_cart_on_user__isnull=False,
+            favorite_user__isnull=False
+        ).first()
+        if user is None or Recipe.objects.count() < self.repeat * 3:
+            raise CommandError('Мало данных: сначала запустите '
+                               'seed_foodgram')
+        media_root = tempfile.mkdtemp()
+        results = {}
+        try:
+            with override_settings(MEDIA_ROOT=media_root), \
+                    transaction.atomic():
+                for name, client, requests in self.get_scenarios(user):
+                    if options['only'] and not name.startswith(
+                        tuple(options['only'])
+                    ):
+                        continue
+                    results[name] = measure_requests(client, requests())
+                    self.stdout.write(format_row(name, results[name]))
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        if options['output']:
+            options['output'].write_text(json.dumps(results, indent=2))
+        if options['compare']:
+            self.compare(json.loads(options['compare'].read_text()), results)
+
+    def get_scenarios(self, user):
+        repeat = self.repeat
+        anonymous = get_client()
+        client = get_client(user)
+        recipe = Recipe.objects.filter(author=user).first() or (
+            Recipe.objects.first()
+        )
+        free_recipes = list(Recipe.objects.exclude(
+            pk__in=Favorite.objects.filter(user=user).values('recipe')
+        ).exclude(
+            pk__in=ShoppingCart.objects.filter(user=user).values('recipe')
+        ).values_list('pk', flat=True)[:repeat])
+        authors = list(User.objects.exclude(pk=user.pk).exclude(
+            pk__in=Subscribe.objects.filter(user=user).values('author')
+        ).values_list('pk', flat=True)[:repeat])
+        tag_ids = list(Tag.objects.values_list('pk', flat=True)[:2])
+        slugs = '&'.join(
+            f'tags={slug}'
+            for slug in Tag.objects.values_list('slug', flat=True)[:2]
+        )
+        ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)[:5]
+        )
+        ingredient = Ingredient.objects.first()
+
+        def same(method, url, data=None):
+            return lambda: [(method, url, data)] * repeat
+
+        def recipe_data(number):
+            return {
+                'ingredients': [{'id': pk, 'amount': number + 1}
+                                for pk in ingredient_ids],
+                'tags': tag_ids,
+                'image': make_image_data(),
+                'name': f'Замер {number}',
+                'text': 'Рецепт для замера',
+                'cooking_time': 10,
+            }
+
+        def create_recipes():
+            return [('post', '/api/recipes/', recipe_data(number))
+                    for number in range(repeat)]
+
+        def created_recipes():
+            return list(Recipe.objects.filter(
+                author=user, name__startswith='Замер '
+            ).values_list('pk', flat=True))
+
+        def on_each(method, template, ids):
+            return lambda: [(method, template.format(pk), None)
+                            for pk in ids]
+
+        recipes_url = '/api/recipes/?limit=6'
+        return (
+            ('recipes.list anonymous', anonymous, same('get', recipes_url)),
+            ('recipes.list', client, same('get', recipes_url)),
+            ('recipes.list limit=50', client,
+             same('get', '/api/recipes/?limit=50')),
+            ('recipes.list tags', client,
+             same('get', f'{recipes_url}&{slugs}')),
+            ('recipes.list author', client,
+             same('get', f'{recipes_url}&author={recipe.author_id}')),
+            ('recipes.list is_favorited', client,
+             same('get', f'{recipes_url}&is_favorited=1')),
+            ('recipes.list is_in_shopping_cart', client,
+             same('get', f'{recipes_url}&is_in_shopping_cart=1')),
+            ('recipes.list popular', client,
+             same('get', f'{recipes_url}&ordering=popular')),
+            ('recipes.list cursor', client,
+             same('get', f'{recipes_url}&pagination=cursor')),
+            ('recipes.retrieve anonymous', anonymous,
+             same('get', f'/api/recipes/{recipe.pk}/')),
+            ('recipes.retrieve', client,
+             same('get', f'/api/recipes/{recipe.pk}/')),
+            ('recipes.create', client, create_recipes),
+            ('recipes.partial_update', client, lambda: [
+                ('patch', f'/api/recipes/{pk}/', {
+                    'name': f'Замер {pk}',
+                    'ingredients': [{'id': ingredient_ids[0],
+                                     'amount': number + 1}],
+                }) for number, pk in enumerate(created_recipes())
+            ]),
+            ('recipes.destroy', client, lambda: [
+                ('delete', f'/api/recipes/{pk}/', None)
+                for pk in created_recipes()
+            ]),
+            ('recipes.favorite add', client,
+             on_each('post', '/api/recipes/{}/favorite/', free_recipes)),
+            ('recipes.favorite remove', client,
+             on_each('delete', '/api/recipes/{}/favorite/', free_recipes)),
+            ('recipes.shopping_cart add', client,
+             on_each('post', '/api/recipes/{}/shopping_cart/',
+                     free_recipes)),
+            ('recipes.shopping_cart remove', client,
+             on_each('delete', '/api/recipes/{}/shopping_cart/',
+                     free_recipes)),
+            ('recipes.favorite bulk add/remove', client, lambda: [
+                (method, '/api/recipes/favorite/', {'recipes': free_recipes})
+                for _ in range(repeat) for method in ('post', 'delete')
+            ]),
+            ('recipes.shopping_cart bulk add/remove', client, lambda: [
+                (method, '/api/recipes/shopping_cart/',
+                 {'recipes': free_recipes})
+                for _ in range(repeat) for method in ('post', 'delete')
+            ]),
+            ('recipes.shopping_cart clear', client, lambda: [
+                ('post', '/api/recipes/shopping_cart/',
+                 {'recipes': free_recipes}),
+                ('post', '/api/recipes/shopping_cart/clear/', None),
+            ] * repeat),
+            ('recipes.download_shopping_cart', client,
+             same('get', '/api/recipes/download_shopping_cart/')),
+            ('recipes.download_shopping_cart csv', client,
+             same('get', '/api/recipes/download_shopping_cart/'
+                         '?file_format=csv')),
+            ('users.list', anonymous, same('get', '/api/users/?limit=6')),
+            ('users.retrieve', client, same('get', f'/api/users/{user.pk}/')),
+            ('users.me', client, same('get', '/api/users/me/')),
+            ('users.me.state', client, same('get', '/api/users/me/state/')),
+            ('users.create', anonymous, lambda: [
+                ('post', '/api/users/', {
+                    'email': f'bench_signup_{number}@example.com',
+                    'username': f'bench_signup_{number}',
+                    'first_name': 'Замер',
+                    'last_name': 'Замер',
+                    'password': 'bench-Password-123',
+                }) for number in range(repeat)
+            ]),
+            ('users.subscriptions', client,
+             same('get', '/api/users/subscriptions/?recipes_limit=3')),
+            ('users.subscribe add', client,
+             on_each('post', '/api/users/{}/subscribe/', authors)),
+            ('users.subscribe remove', client,
+             on_each('delete', '/api/users/{}/subscribe/', authors)),
+            ('tags.list', anonymous, same('get', '/api/tags/')),
+            ('tags.retrieve', anonymous,
+             same('get', f'/api/tags/{tag_ids[0]}/')),
+            ('ingredients.list search', anonymous,
+             same('get', f'/api/ingredients/?name={ingredient.name[:3]}')),
+            ('ingredients.retrieve', anonymous,
+             same('get', f'/api/ingredients/{ingredient.pk}/')),
+        )
+
+    def compare(self, before, after):
+        self.stdout.write('\nСравнение с сохранённым замером:')
+        for name, result in after.items():
+            old = before.get(name)
+            if old is None:
+                continue
+            self.stdout.write(
+                f'{name:<40} queries {old["queries"]} -> '
+                f'{result["queries"]}, p50 {old["p50"]:.1f} -> '
+                f'{result["p50"]:.1f}ms'
+            )
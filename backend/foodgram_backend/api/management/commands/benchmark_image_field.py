@@ -0,0 +1,82 @@
+import base64
+import io
+import multiprocessing
+import os
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from drf_base64.fields import Base64ImageField
+from PIL import Image
+
+from api.fields import StreamingBase64ImageField
+
+FIELDS = {
+    'drf_base64.Base64ImageField': Base64ImageField,
+    'StreamingBase64ImageField': StreamingBase64ImageField,
+}
+
+
+def make_payload(width, height):
+    buffer = io.BytesIO()
+    Image.frombytes(
+        'RGB', (width, height), os.urandom(width * height * 3)
+    ).save(buffer, 'JPEG', quality=95)
+    return 'data:image/jpeg;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def current_rss_kb():
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def run_field(field_name, payload, queue):
+    field = FIELDS[field_name]()
+    if isinstance(field, StreamingBase64ImageField):
+        field.max_bytes = len(payload)
+        field.max_pixels = 10 ** 9
+    rss_before = current_rss_kb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = field.to_internal_value(payload)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    value.close()
+    queue.put((peak // 1024, rss_peak - rss_before, elapsed * 1000))
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пиковую память при разборе base64-картинки '
+            'стандартным и потоковым полем')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+
+    def handle(self, *args, **options):
+        payload = make_payload(options['width'], options['height'])
+        self.stdout.write(
+            f'Размер тела: {len(payload) / 1024 / 1024:.1f} МБ base64'
+        )
+        context = multiprocessing.get_context('fork')
+        for field_name in FIELDS:
+            queue = context.Queue()
+            process = context.Process(target=run_field,
+                                      args=(field_name, payload, queue))
+            process.start()
+            process.join()
+            if process.exitcode:
+                raise CommandError(f'{field_name}: процесс завершился '
+                                   f'с кодом {process.exitcode}')
+            traced_kb, rss_kb, elapsed = queue.get()
+            self.stdout.write(
+                f'{field_name:<30} python peak={traced_kb / 1024:.1f} МБ '
+                f'RSS прирост={rss_kb / 1024:.1f} МБ '
+                f'время={elapsed:.0f} мс'
+            )
@@ -0,0 +1,66 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.benchmarks import percentile
+from recipes.models import Ingredient
+from services import catalog_cache, ingredient_search
+
+ALPHABET = 'абвгдежзиклмнопрстуфхцчшэюя'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p99 поиска ингредиентов по запросам '
+            'длиной 1-3 символа')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=300)
+        parser.add_argument('--backends', nargs='+',
+                            choices=sorted(ingredient_search.BACKENDS),
+                            default=sorted(ingredient_search.BACKENDS))
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=self.random_name(generator, i),
+                            measurement_unit='г')
+                 for i in range(options['ingredients'])],
+                batch_size=5000
+            )
+            catalog_cache.bump_version('ingredients')
+            started = time.perf_counter()
+            ingredient_search.get_index()
+            self.stdout.write(
+                'Построение индекса в памяти: '
+                f'{(time.perf_counter() - started) * 1000:.0f} мс'
+            )
+            for backend in options['backends']:
+                search = ingredient_search.BACKENDS[backend]
+                for length in (1, 2, 3):
+                    timings = []
+                    for _ in range(options['queries']):
+                        query = ''.join(generator.choices(ALPHABET, k=length))
+                        started = time.perf_counter()
+                        search(query, settings.INGREDIENT_SEARCH_LIMIT)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    self.stdout.write(
+                        f'{backend:<8} длина={length} '
+                        f'p50={percentile(timings, 50):.2f}мс '
+                        f'p99={percentile(timings, 99):.2f}мс'
+                    )
+            transaction.set_rollback(True)
+        catalog_cache.bump_version('ingredients')
+
+    @staticmethod
+    def random_name(generator, number):
+        words = [
+            ''.join(generator.choices(ALPHABET, k=generator.randint(3, 9)))
+            for _ in range(generator.randint(1, 3))
+        ]
+        return f'{" ".join(words)} {number}'
@@ -0,0 +1,94 @@
+import random
+import statistics
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from api.benchmarks import create_recipes, format_row, get_client, measure
+from recipes.models import Favorite, Recipe
+from services import recipe_scores
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замеряет сортировку рецептов по популярности на большом '
+            'количестве избранного')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--favorites', type=int, default=1_000_000)
+        parser.add_argument('--favorites-per-user', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_data(options)
+            started = time.perf_counter()
+            total = recipe_scores.refresh()
+            self.stdout.write(
+                f'refresh_recipe_scores: {total} рецептов за '
+                f'{time.perf_counter() - started:.1f} с'
+            )
+            client = get_client()
+            for url in ('/api/recipes/?ordering=popular&limit=6',
+                        '/api/recipes/?ordering=popular&limit=6&page=50'):
+                self.stdout.write(format_row(
+                    url, measure(client, url, options['repeat'])
+                ))
+            timings = []
+            for _ in range(3):
+                started = time.perf_counter()
+                list(Recipe.objects.annotate(
+                    favorites=Count('favorite_recipe')
+                ).order_by('-favorites', '-id')[:6])
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                'для сравнения, COUNT по Favorite на каждый запрос: '
+                f'p50={statistics.median(timings):.1f}ms'
+            )
+            transaction.set_rollback(True)
+
+    def create_data(self, options):
+        started = time.perf_counter()
+        _, recipes = create_recipes(options['recipes'],
+                                    ingredients_per_recipe=2)
+        recipe_ids = [recipe.pk for recipe in recipes]
+        per_user = min(options['favorites_per_user'], len(recipe_ids))
+        users_count = -(-options['favorites'] // per_user)
+        users = User.objects.bulk_create([
+            User(username=f'bench_fan_{i}', email=f'bench_fan_{i}@example.com')
+            for i in range(users_count)
+        ])
+        rng = random.Random(0)
+        # Распределение Ципфа: несколько рецептов заметно популярнее
+        # остальных, как в живой выдаче.
+        cum_weights = list(accumulate(
+            1 / (index + 1) for index in range(len(recipe_ids))
+        ))
+        batch = []
+        created = 0
+        for user in users:
+            chosen = set()
+            while len(chosen) < per_user:
+                chosen.update(rng.choices(
+                    recipe_ids, cum_weights=cum_weights,
+                    k=per_user - len(chosen)
+                ))
+            batch.extend(Favorite(user_id=user.pk, recipe_id=recipe_id)
+                         for recipe_id in chosen)
+            if len(batch) >= options['batch_size']:
+                Favorite.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+            if created >= options['favorites']:
+                break
+        Favorite.objects.bulk_create(batch)
+        created += len(batch)
+        self.stdout.write(
+            f'Создано рецептов: {len(recipe_ids)}, избранного: {created} '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.benchmarks import create_recipes, format_row, get_client, measure
+
+
+class Command(BaseCommand):
+    help = ('Замеряет число запросов и время ответа списка рецептов '
+            'в зависимости от размера страницы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[6, 20, 50, 100])
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users, recipes = create_recipes(options['recipes'])
+            clients = {
+                'anonymous': get_client(),
+                'authenticated': get_client(users[0]),
+            }
+            for name, client in clients.items():
+                for size in options['sizes']:
+                    result = measure(client, f'/api/recipes/?limit={size}',
+                                     options['repeat'])
+                    self.stdout.write(format_row(f'{name} limit={size}',
+                                                 result))
+                result = measure(client, f'/api/recipes/{recipes[0].pk}/',
+                                 options['repeat'])
+                self.stdout.write(format_row(f'{name} detail', result))
+            transaction.set_rollback(True)
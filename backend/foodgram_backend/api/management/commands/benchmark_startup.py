@@ -0,0 +1,143 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from api.benchmarks import BENCHMARK_HOST, percentile
+
+COLD_START_SCRIPT = '''
+import time
+started = time.perf_counter()
+import django
+django.setup()
+from foodgram_backend.wsgi import application
+from api.management.commands.benchmark_startup import call_wsgi
+ready = time.perf_counter()
+call_wsgi(application, {path!r})
+print(ready - started, time.perf_counter() - started)
+'''
+
+
+def call_wsgi(application, path):
+    statuses = []
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path.split('?')[0],
+        'QUERY_STRING': path.partition('?')[2],
+        'SERVER_NAME': BENCHMARK_HOST,
+        'SERVER_PORT': '80',
+        'HTTP_HOST': BENCHMARK_HOST,
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    body = application(environ, lambda status, headers: statuses.append(
+        status
+    ))
+    try:
+        b''.join(body)
+    finally:
+        # Как и настоящий WSGI-сервер: close() отправляет request_finished,
+        # по которому Django закрывает устаревшие соединения.
+        if hasattr(body, 'close'):
+            body.close()
+    return statuses[0]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет холодный старт приложения и установившийся RPS '
+            'для /api/recipes/ при разных CONN_MAX_AGE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/recipes/')
+        parser.add_argument('--cold-runs', type=int, default=3)
+        parser.add_argument('--duration', type=float, default=5,
+                            help='секунд на каждый замер RPS')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--conn-max-age', type=int, nargs='+',
+                            default=[0, 60])
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING(
+                'DEBUG включён: замер не соответствует боевому режиму, '
+                'используйте foodgram_backend.settings_production'
+            ))
+        self.cold_start(options['path'], options['cold_runs'])
+        application = get_wsgi_application()
+        for conn_max_age in options['conn_max_age']:
+            self.steady_state(application, options, conn_max_age)
+
+    def cold_start(self, path, runs):
+        results = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c', COLD_START_SCRIPT.format(path=path)],
+                capture_output=True, text=True, check=True,
+                env={**os.environ,
+                     'DJANGO_SETTINGS_MODULE': os.environ.get(
+                         'DJANGO_SETTINGS_MODULE',
+                         'foodgram_backend.settings'
+                     )},
+                cwd=settings.BASE_DIR
+            ).stdout.split()
+            results.append([float(value) * 1000 for value in output[-2:]])
+        self.stdout.write(
+            f'холодный старт: django.setup() и WSGI '
+            f'{statistics.median(ready for ready, _ in results):.0f}ms, '
+            f'до первого ответа '
+            f'{statistics.median(first for _, first in results):.0f}ms '
+            f'(медиана из {runs})'
+        )
+
+    def steady_state(self, application, options, conn_max_age):
+        for connection in connections.all():
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+        opened = []
+
+        def on_connection_created(**kwargs):
+            opened.append(1)
+
+        def worker(deadline):
+            timings = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                call_wsgi(application, options['path'])
+                timings.append((time.perf_counter() - started) * 1000)
+            for connection in connections.all():
+                connection.close()
+            return timings
+
+        call_wsgi(application, options['path'])
+        connection_created.connect(on_connection_created)
+        try:
+            deadline = time.perf_counter() + options['duration']
+            with ThreadPoolExecutor(options['threads']) as executor:
+                timings = [
+                    timing for result in executor.map(
+                        worker, [deadline] * options['threads']
+                    ) for timing in result
+                ]
+        finally:
+            connection_created.disconnect(on_connection_created)
+        self.stdout.write(
+            f'CONN_MAX_AGE={conn_max_age:<4} потоков={options["threads"]} '
+            f'RPS={len(timings) / options["duration"]:.0f} '
+            f'p50={statistics.median(timings):.1f}ms '
+            f'p95={percentile(timings, 95):.1f}ms '
+            f'новых соединений={len(opened)}'
+        )
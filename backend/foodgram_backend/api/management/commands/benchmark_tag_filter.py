@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.benchmarks import create_recipes, format_row, get_client, measure
+from api.filters import RecipeFilter
+from recipes.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает планы и время фильтрации рецептов по тегам '
+            'через JOIN и через подзапросы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--explain', action='store_true',
+                            help='вывести планы запросов')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            create_recipes(options['recipes'], ingredients_per_recipe=2)
+            slugs = list(Tag.objects.filter(
+                slug__startswith='bench-tag-'
+            ).order_by('id').values_list('slug', flat=True)[:3])
+            join_queryset = Recipe.objects.filter(tags__slug__in=slugs)
+            self.stdout.write(
+                f'JOIN по {len(slugs)} тегам: {join_queryset.count()} строк, '
+                f'из них рецептов {join_queryset.distinct().count()}'
+            )
+            client = get_client()
+            query = '&'.join(f'tags={slug}' for slug in slugs)
+            for mode in ('any', 'all'):
+                url = f'/api/recipes/?limit=6&{query}&tags_mode={mode}'
+                self.stdout.write(format_row(
+                    f'tags_mode={mode}',
+                    measure(client, url, options['repeat'])
+                ))
+            if options['explain']:
+                self.explain(slugs)
+            transaction.set_rollback(True)
+
+    def explain(self, slugs):
+        for mode in ('any', 'all'):
+            recipe_filter = RecipeFilter(
+                {'tags': slugs, 'tags_mode': mode},
+                queryset=Recipe.objects.all()
+            )
+            self.stdout.write(f'\n-- tags_mode={mode}')
+            self.stdout.write(recipe_filter.qs[:6].explain())
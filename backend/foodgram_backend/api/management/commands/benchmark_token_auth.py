@@ -0,0 +1,51 @@
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import reset_token_cache
+from api.benchmarks import (BENCHMARK_HOST, format_row, measure,
+                            percentile)
+from users.models import User
+
+URL = '/api/users/me/'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет аутентификацию по токену с пустым и прогретым '
+            'кешем токенов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username='bench_token_user',
+                email='bench_token_user@example.com',
+            )
+            token = Token.objects.create(user=user)
+            client = APIClient(HTTP_HOST=BENCHMARK_HOST,
+                               HTTP_AUTHORIZATION=f'Token {token.key}')
+            cold = [
+                self.measure_cold(client) for _ in range(options['repeat'])
+            ]
+            timings = [row['p50'] for row in cold]
+            self.stdout.write(format_row(f'{URL} (без кеша)', {
+                **cold[-1],
+                'p50': statistics.median(timings),
+                'p95': percentile(timings, 95),
+            }))
+            reset_token_cache()
+            self.stdout.write(format_row(
+                f'{URL} (кеш)', measure(client, URL, options['repeat'])
+            ))
+            reset_token_cache()
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure_cold(client):
+        reset_token_cache()
+        return measure(client, URL, repeat=1)
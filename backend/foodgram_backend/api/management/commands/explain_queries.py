@@ -0,0 +1,160 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.benchmarks import get_client
+from recipes.models import Ingredient, Recipe, Tag
+from services import catalog_cache
+from users.models import User
+
+ENDPOINTS = (
+    ('recipes', '/api/recipes/?limit=6'),
+    ('recipes_by_author', '/api/recipes/?limit=6&author={author}'),
+    ('recipes_tags_any', '/api/recipes/?limit=6&{tags}'),
+    ('recipes_tags_all', '/api/recipes/?limit=6&{tags}&tags_mode=all'),
+    ('recipes_favorited', '/api/recipes/?limit=6&is_favorited=1'),
+    ('recipes_in_shopping_cart',
+     '/api/recipes/?limit=6&is_in_shopping_cart=1'),
+    ('recipes_popular', '/api/recipes/?limit=6&ordering=popular'),
+    ('recipe_detail', '/api/recipes/{recipe}/'),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+    ('ingredients_search', '/api/ingredients/?name={ingredient}'),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/'),
+)
+
+
+def get_explain_prefix():
+    if connection.vendor == 'postgresql':
+        return 'EXPLAIN (ANALYZE, BUFFERS) '
+    if connection.vendor == 'sqlite':
+        return 'EXPLAIN QUERY PLAN '
+    return 'EXPLAIN '
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(get_explain_prefix() + sql)
+        return '\n'.join(
+            ' '.join(str(column) for column in row)
+            for row in cursor.fetchall()
+        )
+
+
+class Command(BaseCommand):
+    help = ('Снимает планы запросов (EXPLAIN ANALYZE на PostgreSQL) '
+            'для основных эндпоинтов на текущей базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int,
+                            help='id пользователя, от имени которого '
+                                 'выполняются запросы')
+        parser.add_argument('--output', type=Path,
+                            help='сохранить результат в JSON')
+        parser.add_argument('--compare', type=Path,
+                            help='сравнить с ранее сохранённым JSON')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        user = self.get_user(options['user'])
+        params = self.get_params(user)
+        # Каталог ингредиентов кешируется, без сброса версии
+        # поиск не дойдёт до базы.
+        catalog_cache.bump_version('ingredients')
+        client = get_client(user)
+        results = {}
+        for name, url in ENDPOINTS:
+            results[name] = self.capture(client, url.format(**params))
+        if options['output']:
+            options['output'].write_text(
+                json.dumps(results, ensure_ascii=False, indent=2)
+            )
+        if options['compare']:
+            self.compare(json.loads(options['compare'].read_text()), results)
+        else:
+            self.report(results)
+
+    @staticmethod
+    def get_user(user_id):
+        if user_id is not None:
+            user = User.objects.filter(pk=user_id).first()
+        else:
+            user = User.objects.filter(
+                favorite_user__isnull=False
+            ).first() or User.objects.first()
+        if user is None:
+            raise CommandError('В базе нет пользователей, '
+                               'сначала заполните её данными')
+        return user
+
+    @staticmethod
+    def get_params(user):
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if recipe is None or ingredient is None:
+            raise CommandError('В базе нет рецептов или ингредиентов')
+        slugs = Tag.objects.order_by('id').values_list('slug', flat=True)
+        return {
+            'author': recipe.author_id,
+            'recipe': recipe.pk,
+            'tags': '&'.join(f'tags={slug}' for slug in slugs[:2]),
+            'ingredient': ingredient.name[:3].lower(),
+        }
+
+    @staticmethod
+    def capture(client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        queries = [
+            {
+                'sql': query['sql'],
+                'time_ms': float(query['time']) * 1000,
+                'plan': explain(query['sql']),
+            }
+            for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+        return {
+            'url': url,
+            'status': response.status_code,
+            'total_ms': sum(query['time_ms'] for query in queries),
+            'queries': queries,
+        }
+
+    def report(self, results):
+        for name, result in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name} {result["url"]} status={result["status"]} '
+                f'queries={len(result["queries"])} '
+                f'db={result["total_ms"]:.1f}ms'
+            ))
+            for query in result['queries']:
+                self.stdout.write(f'{query["time_ms"]:.1f}ms {query["sql"]}')
+                self.stdout.write(query['plan'])
+
+    def compare(self, before, after):
+        for name, result in after.items():
+            old = before.get(name)
+            if old is None:
+                self.stdout.write(f'{name}: нет в исходном замере')
+                continue
+            changed = [
+                index for index, (old_query, new_query) in enumerate(
+                    zip(old['queries'], result['queries'])
+                ) if old_query['plan'] != new_query['plan']
+            ]
+            self.stdout.write(
+                f'{name:<26} queries {len(old["queries"])} -> '
+                f'{len(result["queries"])}, db {old["total_ms"]:.1f} -> '
+                f'{result["total_ms"]:.1f}ms, '
+                f'планов изменилось: {len(changed)}'
+            )
+            if self.verbosity > 1:
+                for index in changed:
+                    self.stdout.write(old['queries'][index]['plan'])
+                    self.stdout.write('->')
+                    self.stdout.write(result['queries'][index]['plan'])
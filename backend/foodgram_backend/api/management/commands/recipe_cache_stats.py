@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from services import response_cache
+
+
+class Command(BaseCommand):
+    help = ('Показывает попадания и промахи кеша ответов рецептов для '
+            'анонимных пользователей. С LocMemCache счётчики у каждого '
+            'процесса свои, общие видны только с общим кешем (Redis)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики')
+
+    def handle(self, *args, **options):
+        stats = response_cache.get_stats()
+        self.stdout.write(
+            f'hits={stats["hits"]} misses={stats["misses"]} '
+            f'hit_ratio={stats["hit_ratio"]:.1%}'
+        )
+        if options['reset']:
+            response_cache.reset_stats()
@@ -0,0 +1,146 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SPACES_RE = re.compile(r'\s+')
+
+
+def get_query_shape(sql):
+    shape = IN_LIST_RE.sub('IN (...)', sql)
+    shape = LITERAL_RE.sub('?', shape)
+    return SPACES_RE.sub(' ', shape).strip()
+
+
+class QueryCollector:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[get_query_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.items()
+                if count > threshold]
+
+
+class SerializationTimer:
+    """Время в serializer.data без запросов к БД внутри него."""
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.duration = 0.0
+        self.depth = 0
+
+    @contextmanager
+    def measure(self):
+        # Вложенные вызовы serializer.data уже учтены во внешнем.
+        self.depth += 1
+        started = time.perf_counter()
+        db_started = self.collector.duration
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.duration += (time.perf_counter() - started
+                                  - (self.collector.duration - db_started))
+
+
+def measure_serialization(request):
+    timer = getattr(request, 'instrumentation_serialization', None)
+    if timer is None:
+        return nullcontext()
+    return timer.measure()
+
+
+class RequestInstrumentationMiddleware:
+    """Замеряет запросы к БД, время обработки, сериализации и размер
+    ответа.
+
+    Включается настройкой REQUEST_INSTRUMENTATION. Запросы, выполненные
+    при отдаче StreamingHttpResponse, уже после возврата из view,
+    не учитываются.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.threshold = settings.REQUEST_INSTRUMENTATION_REPEAT_THRESHOLD
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        started = time.perf_counter()
+        request.instrumentation_render_started = None
+        serialization = SerializationTimer(collector)
+        request.instrumentation_serialization = serialization
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        render_started = request.instrumentation_render_started or finished
+        timings = {
+            'db': collector.duration,
+            'app': (render_started - started - collector.duration
+                    - serialization.duration),
+            'serialize': serialization.duration,
+            'render': finished - render_started,
+            'total': finished - started,
+        }
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={value * 1000:.1f}'
+            + (f';desc="{collector.count} queries"' if name == 'db' else '')
+            for name, value in timings.items()
+        )
+        self.log(request, response, collector, timings)
+        return response
+
+    def process_template_response(self, request, response):
+        # Вызывается после view и до рендеринга ответа DRF.
+        request.instrumentation_render_started = time.perf_counter()
+        return response
+
+    def log(self, request, response, collector, timings):
+        resolver_match = request.resolver_match
+        repeated = collector.repeated(self.threshold)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': resolver_match.view_name if resolver_match else None,
+            'status': response.status_code,
+            'queries': collector.count,
+            'size': (None if response.streaming
+                     else len(response.content)),
+            **{f'{name}_ms': round(value * 1000, 1)
+               for name, value in timings.items()},
+        }
+        if response.has_header('X-Cache'):
+            record['cache'] = response['X-Cache']
+        if repeated:
+            record['repeated_queries'] = [
+                {'count': count, 'sql': shape} for shape, count in repeated
+            ]
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
@@ -1,15 +1,24 @@
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from recipes.models import Recipe
+from recipes.models import Favorite, Recipe, ShoppingCart
+from services import (catalog_cache, counters, relations, response_cache,
+                      shopping_list, user_state)
 from users.models import User
-from .serializers import RecipeSerializer, SubscribeAuthorSerializer
+from .serializers import (RecipeIdsSerializer, RecipeSerializer,
+                          SubscribeAuthorSerializer)
 
 
 class SubscribeFavoriteShoppingCartMixin:
 
     @staticmethod
+    @transaction.atomic
     def create_method(input_model, action_model, author_or_recipe_pk, request):
         user = request.user
         if input_model == Recipe:
@@ -17,23 +26,42 @@ class SubscribeFavoriteShoppingCartMixin:
             serializer = RecipeSerializer(
                 instance=recipe, context={'request': request}
             )
-            if not action_model.objects.filter(
-                recipe=recipe, user=user
-            ).exists():
-                action_model.objects.create(user=user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+            if not relations.insert_ignore(
+                action_model, [{'user': user.pk, 'recipe': recipe.pk}],
+                returning=['recipe']
+            ):
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            if action_model == ShoppingCart:
+                shopping_list.add_recipe(user, recipe)
+            if action_model == Favorite:
+                counters.change_favorites(recipe, 1)
+            user_state.bump_version(user)
+            return Response(serializer.data,
+                            status=status.HTTP_201_CREATED)
         if input_model == User:
-            author = get_object_or_404(input_model, pk=author_or_recipe_pk)
+            # Подписку на себя отклоняем до обращения к БД.
+            try:
+                author_id = int(author_or_recipe_pk)
+            except ValueError:
+                raise Http404
+            if author_id == user.pk:
+                raise ValidationError('Нельзя подписаться на самого себя')
+            author = get_object_or_404(input_model, pk=author_id)
             serializer = SubscribeAuthorSerializer(
                 instance=author, context={'request': request}
             )
-            action_model.objects.create(user=user, author=author)
+            if not relations.insert_ignore(
+                action_model, [{'user': user.pk, 'author': author.pk}],
+                returning=['author']
+            ):
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            counters.change_subscribers(author, 1)
+            user_state.bump_version(user)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
 
     @staticmethod
+    @transaction.atomic
     def delete_method(input_model, action_model, author_or_recipe_pk, request):
         user = request.user
         author_or_recipe = get_object_or_404(
@@ -41,13 +69,183 @@ class SubscribeFavoriteShoppingCartMixin:
             pk=author_or_recipe_pk
         )
         if input_model == Recipe:
-            action_model.objects.filter(
+            deleted, _ = action_model.objects.filter(
                 user=user,
                 recipe=author_or_recipe
             ).delete()
+            if deleted and action_model == ShoppingCart:
+                shopping_list.remove_recipe(user, author_or_recipe)
+            if deleted and action_model == Favorite:
+                counters.change_favorites(author_or_recipe, -1)
+            if deleted:
+                user_state.bump_version(user)
         if input_model == User:
-            action_model.objects.filter(
+            deleted, _ = action_model.objects.filter(
                 user=user,
                 author=author_or_recipe
             ).delete()
+            if deleted:
+                counters.change_subscribers(author_or_recipe, -1)
+                user_state.bump_version(user)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def bulk_method(self, action_model, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(
+            serializer.validated_data['recipes']
+        ))
+        if request.method == 'POST':
+            results = self.bulk_create_method(action_model, recipe_ids,
+                                              request.user)
+        else:
+            results = self.bulk_delete_method(action_model, recipe_ids,
+                                              request.user)
+        return Response({'results': [
+            {'id': recipe_id, 'status': results[recipe_id]}
+            for recipe_id in recipe_ids
+        ]})
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_create_method(action_model, recipe_ids, user):
+        found = set(Recipe.objects.filter(pk__in=recipe_ids).values_list(
+            'pk', flat=True
+        ))
+        added = {recipe_id for recipe_id, in relations.insert_ignore(
+            action_model,
+            [{'user': user.pk, 'recipe': recipe_id}
+             for recipe_id in recipe_ids if recipe_id in found],
+            returning=['recipe']
+        )}
+        if added:
+            if action_model == ShoppingCart:
+                shopping_list.add_recipes(user, added)
+            if action_model == Favorite:
+                counters.change_favorites_many(added, 1)
+            user_state.bump_version(user)
+        return {
+            recipe_id: ('not_found' if recipe_id not in found
+                        else 'added' if recipe_id in added
+                        else 'exists')
+            for recipe_id in recipe_ids
+        }
+
+    @staticmethod
+    @transaction.atomic
+    def bulk_delete_method(action_model, recipe_ids, user):
+        found = set(Recipe.objects.filter(pk__in=recipe_ids).values_list(
+            'pk', flat=True
+        ))
+        present = set(action_model.objects.select_for_update().filter(
+            user=user, recipe_id__in=found
+        ).values_list('recipe_id', flat=True))
+        if present:
+            action_model.objects.filter(
+                user=user, recipe_id__in=present
+            ).delete()
+            if action_model == ShoppingCart:
+                shopping_list.remove_recipes(user, present)
+            if action_model == Favorite:
+                counters.change_favorites_many(present, -1)
+            user_state.bump_version(user)
+        return {
+            recipe_id: ('not_found' if recipe_id not in found
+                        else 'removed' if recipe_id in present
+                        else 'absent')
+            for recipe_id in recipe_ids
+        }
+
+    @staticmethod
+    @transaction.atomic
+    def clear_shopping_cart_method(user):
+        deleted, _ = ShoppingCart.objects.filter(user=user).delete()
+        if deleted:
+            shopping_list.clear(user)
+            user_state.bump_version(user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CatalogCacheMixin:
+    catalog = None
+
+    def get_cache_params(self, request):
+        return {
+            key: value.strip().lower()
+            for key, value in request.query_params.items()
+        }
+
+    def list(self, request, *args, **kwargs):
+        entry = catalog_cache.get_or_build(
+            self.catalog,
+            self.get_cache_params(request),
+            lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs
+            ).data
+        )
+        etag = quote_etag(entry['etag'])
+        conditional_response = get_conditional_response(
+            request, etag=etag, last_modified=entry['last_modified']
+        )
+        if conditional_response is not None:
+            response = Response(status=conditional_response.status_code)
+        else:
+            response = Response(entry['data'])
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует ответы list и retrieve для анонимных пользователей."""
+
+    def get_cache_params(self, request):
+        # Ссылки на страницы и картинки абсолютные, поэтому хост и схема
+        # тоже входят в ключ.
+        return {
+            'host': request.get_host(),
+            'scheme': request.scheme,
+            'query': sorted(
+                (key, sorted(values))
+                for key, values in request.query_params.lists()
+            ),
+        }
+
+    def cached_response(self, request, scope, build):
+        if request.user.is_authenticated:
+            return build()
+        key = response_cache.get_key(scope, self.get_cache_params(request))
+        data = response_cache.get_data(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set_data(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, response_cache.LIST_SCOPE,
+            lambda: super(AnonymousResponseCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            return super(AnonymousResponseCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        # Версия сбрасывается по числовому id, поэтому /api/recipes/01/
+        # должен попасть в ту же область, что и /api/recipes/1/.
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except ValueError:
+            return build()
+        return self.cached_response(
+            request, response_cache.get_recipe_scope(pk), build
+        )
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_base64.fields import Base64ImageField
@@ -5,10 +6,37 @@ from rest_framework import serializers
 
 from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
                             ShoppingCart, Tag)
+from services import counters, recipe_images, shopping_list
 from users.models import Subscribe, User
+from .fields import StreamingBase64ImageField
+from .middleware import measure_serialization
 
 
-class CustomUserSerializer(UserSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+
+    @property
+    def data(self):
+        with measure_serialization(self.context.get('request')):
+            return super().data
+
+
+class TimedDataMixin:
+    """Время serializer.data попадает в замер api.middleware."""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # many=True создаёт Meta.list_serializer_class.
+        meta = cls.__dict__.get('Meta')
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with measure_serialization(self.context.get('request')):
+            return super().data
+
+
+class CustomUserSerializer(TimedDataMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -23,6 +51,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is not None:
             current_user = request.user
@@ -32,7 +62,7 @@ class CustomUserSerializer(UserSerializer):
         return False
 
 
-class AuthUserSerializer(UserSerializer):
+class AuthUserSerializer(TimedDataMixin, UserSerializer):
 
     class Meta:
         model = User
@@ -62,7 +92,17 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         }
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return recipe_images.get_variant_urls(
+            obj, self.context.get('request')
+        )
+
+
+class RecipeSerializer(TimedDataMixin, ImageVariantsMixin,
+                       serializers.ModelSerializer):
     name = serializers.ReadOnlyField()
     image = Base64ImageField(read_only=True)
     cooking_time = serializers.ReadOnlyField()
@@ -73,17 +113,29 @@ class RecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionsQuerySerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPES_BULK_LIMIT
+    )
+
+
+class SubscriptionSerializer(TimedDataMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
+    recipes = RecipeSerializer(
+        many=True, read_only=True, source='recent_recipes'
     )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -99,33 +151,15 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is not None:
-            current_user = request.user
-            if current_user.is_authenticated:
-                return Subscribe.objects.filter(user=current_user,
-                                                author=obj).exists()
-        return False
-
-    def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = RecipeSerializer(recipes, many=True, read_only=True)
-        return serializer.data
+        return True
 
 
-class SubscribeAuthorSerializer(serializers.ModelSerializer):
+class SubscribeAuthorSerializer(TimedDataMixin, serializers.ModelSerializer):
     username = serializers.ReadOnlyField()
     email = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
     recipes = RecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -140,13 +174,6 @@ class SubscribeAuthorSerializer(serializers.ModelSerializer):
             'recipes_count'
         )
 
-    def validate(self, obj):
-        if (self.context['request'].user == obj):
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя'
-            )
-        return obj
-
     def get_is_subscribed(self, obj):
         return (
             self.context.get('request').user.is_authenticated
@@ -155,14 +182,14 @@ class SubscribeAuthorSerializer(serializers.ModelSerializer):
         )
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedDataMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedDataMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
@@ -194,7 +221,8 @@ class IngredientsInRecipeSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipeGetSerializer(serializers.ModelSerializer):
+class RecipeGetSerializer(TimedDataMixin, ImageVariantsMixin,
+                          serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientsInRecipeSerializer(
@@ -214,11 +242,14 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is not None:
             current_user = request.user
@@ -228,6 +259,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return (
             self.context.get('request').user.is_authenticated
             and ShoppingCart.objects.filter(
@@ -235,7 +268,7 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
+class RecipeWriteSerializer(TimedDataMixin, serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
     author = CustomUserSerializer(read_only=True)
     tags = serializers.PrimaryKeyRelatedField(
@@ -243,7 +276,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all()
     )
     ingredients = IngredientsForCreateRecipeSerializer(many=True)
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -259,9 +292,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, obj):
-        self._validate_ingredients(obj['ingredients'])
-        self._validate_tags(obj['tags'])
-        self._validate_cooking_time(obj['cooking_time'])
+        if 'ingredients' in obj:
+            self._validate_ingredients(obj['ingredients'])
+        if 'tags' in obj:
+            self._validate_tags(obj['tags'])
+        if 'cooking_time' in obj:
+            self._validate_cooking_time(obj['cooking_time'])
         return obj
 
     def _validate_ingredients(self, ingredients):
@@ -282,6 +318,19 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     'Вес ингредиентов должен быть больше 0'
                 )
+        existing = Ingredient.objects.in_bulk(
+            [ingredient['id'] for ingredient in ingredients]
+        )
+        missing = [
+            ingredient['id'] for ingredient in ingredients
+            if ingredient['id'] not in existing
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {0}'.format(
+                    ', '.join(map(str, missing))
+                )
+            )
         return ingredients
 
     def _validate_tags(self, tags):
@@ -310,11 +359,21 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         IngredientsInRecipe.objects.bulk_create(
             [IngredientsInRecipe(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл картинки удаляем сразу, не дожидаясь сборщика
+            # мусора; хранилище к этому моменту уже перенесло его к себе.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
@@ -322,18 +381,78 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=self.context['request'].user,
                                        **validated_data)
         self.set_tags_ingredients(recipe, tags, ingredients)
+        counters.change_recipes(recipe.author, 1)
+        self.schedule_image_variants(recipe)
         return recipe
 
-    @transaction.atomic
-    def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+    @staticmethod
+    def schedule_image_variants(recipe):
+        if recipe.image:
+            transaction.on_commit(
+                lambda: recipe_images.schedule(recipe.pk)
+            )
+
+    def update_tags(self, recipe, tags):
+        current_tags = set(recipe.tags.values_list('pk', flat=True))
+        if current_tags != {tag.pk for tag in tags}:
+            recipe.tags.set(tags)
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            item.ingredient_id: item
+            for item in IngredientsInRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        if old_amounts == new_amounts:
+            return
+        to_update = []
+        for ingredient_id, item in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                to_update.append(item)
         IngredientsInRecipe.objects.filter(
-            recipe=instance, ingredient__in=instance.ingredients.all()
+            pk__in=[
+                item.pk for ingredient_id, item in current.items()
+                if ingredient_id not in new_amounts
+            ]
         ).delete()
-        self.set_tags_ingredients(instance, tags, ingredients)
-        instance.save()
+        IngredientsInRecipe.objects.bulk_update(to_update, ['amount'])
+        IngredientsInRecipe.objects.bulk_create(
+            [IngredientsInRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            ) for ingredient_id, amount in new_amounts.items()
+                if ingredient_id not in current]
+        )
+        shopping_list.update_recipe(recipe, old_amounts, new_amounts)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        if 'image' in validated_data:
+            recipe_images.delete_variants(instance.image_variants)
+            validated_data['image_variants'] = {}
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            self.schedule_image_variants(instance)
         return instance
 
     def to_representation(self, instance):
+        instance = Recipe.objects.with_related(
+            self.context['request'].user
+        ).get(pk=instance.pk)
         return RecipeGetSerializer(instance, context=self.context).data
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from users.models import User
+
+
+def invalidate_now_and_on_commit(keys):
+    # Второй раз после коммита: иначе параллельный запрос успеет снова
+    # закешировать токен, пока удаление ещё не зафиксировано.
+    keys = list(keys)
+    invalidate_tokens(keys)
+    transaction.on_commit(lambda: invalidate_tokens(keys))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    invalidate_now_and_on_commit([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, **kwargs):
+    if not created:
+        invalidate_now_and_on_commit(
+            Token.objects.filter(user=instance).values_list('key', flat=True)
+        )
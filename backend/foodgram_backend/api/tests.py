@@ -1,6 +1,53 @@
+import base64
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from http import HTTPStatus
+from unittest import mock, skipIf, skipUnless
 
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.http import JsonResponse
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from api.authentication import CachedTokenAuthentication, reset_token_cache
+from api.fields import StreamingBase64ImageField
+from api.middleware import QueryCollector, SerializationTimer, get_query_shape
+from api.views import RecipeViewSet
+
+from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from services import catalog_cache, counters, response_cache, shopping_list
+from services.build_shopping_cart_file import SHOPPING_CART_FILE_SERVICES
+from users.models import Subscribe, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image_data(size=(2, 2), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, image_format)
+    return 'data:image/{0};base64,{1}'.format(
+        image_format.lower(), base64.b64encode(buffer.getvalue()).decode()
+    )
 
 
 class FoodgramAPITestCase(TestCase):
@@ -11,3 +58,1786 @@ class FoodgramAPITestCase(TestCase):
         """Проверка доступности списка пользователей."""
         response = self.guest_client.get('/api/users/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class RecipeListQueriesTestCase(TestCase):
+    USER_FLAG_TABLES = (
+        Favorite._meta.db_table,
+        ShoppingCart._meta.db_table,
+        Subscribe._meta.db_table,
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass'
+            ) for i in range(5)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.authors[i % len(cls.authors)],
+                name=f'Рецепт {i}', text='Описание', cooking_time=10
+            ) for i in range(12)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color='#FFFFFF',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+        for recipe in cls.recipes:
+            recipe.tags.set(tags)
+            IngredientsInRecipe.objects.bulk_create([
+                IngredientsInRecipe(recipe=recipe, ingredient=ingredient,
+                                    amount=10)
+                for ingredient in ingredients
+            ])
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[1])
+        Subscribe.objects.create(user=cls.user, author=cls.authors[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _user_flag_queries(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/recipes/?limit={limit}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            query for query in context.captured_queries
+            if any(table in query['sql'] for table in self.USER_FLAG_TABLES)
+        ]
+
+    def test_user_flags_do_not_depend_on_page_size(self):
+        """Флаги пользователя вычисляются за постоянное число запросов."""
+        self.assertEqual(
+            len(self._user_flag_queries(2)),
+            len(self._user_flag_queries(12))
+        )
+
+    def _count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(context.captured_queries)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        """Список рецептов загружается за постоянное число запросов."""
+        clients = {'anonymous': APIClient(), 'authenticated': self.client}
+        for name, client in clients.items():
+            with self.subTest(client=name):
+                self.assertEqual(
+                    self._count_queries(client, '/api/recipes/?limit=2'),
+                    self._count_queries(client, '/api/recipes/?limit=12')
+                )
+
+    def test_list_contains_tags_and_ingredients(self):
+        """Теги и ингредиенты рецепта попадают в выдачу списка."""
+        response = self.client.get('/api/recipes/?limit=1')
+        recipe = response.json()['results'][0]
+        self.assertEqual(len(recipe['tags']), 3)
+        self.assertEqual(len(recipe['ingredients']), 4)
+        self.assertEqual(recipe['ingredients'][0]['measurement_unit'], 'г')
+
+    def test_user_flags_values(self):
+        """Флаги избранного, корзины и подписки вычисляются верно."""
+        response = self.client.get('/api/recipes/?limit=12')
+        results = {
+            recipe['id']: recipe for recipe in response.json()['results']
+        }
+        favorited = results[self.recipes[0].id]
+        in_cart = results[self.recipes[1].id]
+        other = results[self.recipes[2].id]
+        self.assertTrue(favorited['is_favorited'])
+        self.assertFalse(favorited['is_in_shopping_cart'])
+        self.assertTrue(favorited['author']['is_subscribed'])
+        self.assertTrue(in_cart['is_in_shopping_cart'])
+        self.assertFalse(in_cart['is_favorited'])
+        self.assertFalse(in_cart['author']['is_subscribed'])
+        self.assertFalse(other['is_favorited'])
+        self.assertFalse(other['is_in_shopping_cart'])
+
+    def test_anonymous_user_flags(self):
+        """Анонимный пользователь получает ложные флаги."""
+        response = APIClient().get('/api/recipes/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for recipe in response.json()['results']:
+            self.assertFalse(recipe['is_favorited'])
+            self.assertFalse(recipe['is_in_shopping_cart'])
+            self.assertFalse(recipe['author']['is_subscribed'])
+
+
+class DownloadShoppingCartTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='pass'
+        )
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        milk = Ingredient.objects.create(name='Молоко', measurement_unit='мл')
+        for amount in (5, 10):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {amount}', text='Описание',
+                cooking_time=10
+            )
+            IngredientsInRecipe.objects.bulk_create([
+                IngredientsInRecipe(recipe=recipe, ingredient=salt,
+                                    amount=amount),
+                IngredientsInRecipe(recipe=recipe, ingredient=milk,
+                                    amount=amount * 10),
+            ])
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        shopping_list.rebuild()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _download(self, file_format):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'file_format': file_format}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_download_txt(self):
+        """Список покупок в txt агрегирован и отсортирован по названию."""
+        self.assertEqual(
+            self._download('txt'),
+            'Ваш список покупок:\nМолоко (мл) 150\nСоль (г) 15'
+        )
+
+    def test_download_csv(self):
+        """Список покупок выгружается в csv."""
+        self.assertEqual(
+            self._download('csv').splitlines(),
+            ['Ингредиент,Единица измерения,Количество',
+             'Молоко,мл,150',
+             'Соль,г,15']
+        )
+
+    @skipUnless('pdf' in SHOPPING_CART_FILE_SERVICES,
+                'нужны reportlab и шрифт SHOPPING_CART_PDF_FONT')
+    def test_download_pdf(self):
+        """Список покупок выгружается в PDF со шрифтом с кириллицей."""
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'file_format': 'pdf'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', content)
+
+    def test_download_unknown_format(self):
+        """Неизвестный формат выгрузки возвращает ошибку."""
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'file_format': 'doc'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class ShoppingListMaintenanceTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#FFFFFF',
+                                     slug='lunch')
+        cls.salt = Ingredient.objects.create(name='Соль',
+                                             measurement_unit='г')
+        cls.milk = Ingredient.objects.create(name='Молоко',
+                                             measurement_unit='мл')
+        cls.sugar = Ingredient.objects.create(name='Сахар',
+                                              measurement_unit='г')
+        cls.recipes = []
+        for amount in (5, 10):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {amount}',
+                text='Описание', cooking_time=10
+            )
+            recipe.tags.set([cls.tag])
+            IngredientsInRecipe.objects.bulk_create([
+                IngredientsInRecipe(recipe=recipe, ingredient=cls.salt,
+                                    amount=amount),
+                IngredientsInRecipe(recipe=recipe, ingredient=cls.milk,
+                                    amount=amount * 10),
+            ])
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+
+    def _totals(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient__name', 'total_amount'
+            )
+        )
+
+    def _add_to_cart(self, recipe):
+        response = self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+
+    def test_add_and_remove_recipes(self):
+        """Список покупок меняется при добавлении и удалении из корзины."""
+        for recipe in self.recipes:
+            self._add_to_cart(recipe)
+        self.assertEqual(self._totals(), {'Соль': 15, 'Молоко': 150})
+        self.client.delete(f'/api/recipes/{self.recipes[0].pk}/shopping_cart/')
+        self.assertEqual(self._totals(), {'Соль': 10, 'Молоко': 100})
+        self.client.delete(f'/api/recipes/{self.recipes[1].pk}/shopping_cart/')
+        self.assertEqual(self._totals(), {})
+        self.assertEqual(shopping_list.find_inconsistencies(), [])
+
+    def test_recipe_update_changes_shopping_list(self):
+        """Изменение ингредиентов рецепта отражается в списке покупок."""
+        for recipe in self.recipes:
+            self._add_to_cart(recipe)
+        response = self.author_client.patch(
+            f'/api/recipes/{self.recipes[0].pk}/',
+            {
+                'ingredients': [{'id': self.salt.pk, 'amount': 7},
+                                {'id': self.sugar.pk, 'amount': 3}],
+                'tags': [self.tag.pk],
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self._totals(),
+                         {'Соль': 17, 'Молоко': 100, 'Сахар': 3})
+        self.assertEqual(shopping_list.find_inconsistencies(), [])
+
+    def test_recipe_delete_changes_shopping_list(self):
+        """Удаление рецепта убирает его ингредиенты из списков покупок."""
+        for recipe in self.recipes:
+            self._add_to_cart(recipe)
+        response = self.author_client.delete(
+            f'/api/recipes/{self.recipes[1].pk}/'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(self._totals(), {'Соль': 5, 'Молоко': 50})
+
+    def test_author_delete_changes_shopping_list(self):
+        """Удаление автора убирает его рецепты из списков покупок и
+        поправляет счётчики."""
+        for recipe in self.recipes:
+            self._add_to_cart(recipe)
+        self.author_client.post(f'/api/users/{self.user.pk}/subscribe/')
+        response = self.author_client.delete(
+            '/api/users/me/', {'current_password': 'pass'}, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(self._totals(), {})
+        self.assertEqual(shopping_list.find_inconsistencies(), [])
+        self.assertEqual(counters.find_inconsistencies(), [])
+
+    def test_rebuild_fixes_inconsistencies(self):
+        """Пересборка восстанавливает список после правок в обход API."""
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        self.assertEqual(len(shopping_list.find_inconsistencies()), 2)
+        shopping_list.rebuild()
+        self.assertEqual(shopping_list.find_inconsistencies(), [])
+        self.assertEqual(self._totals(), {'Соль': 5, 'Молоко': 50})
+
+
+class LoadIngredientsTestCase(TestCase):
+
+    def _load(self, content, suffix):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, encoding='utf-8', delete=False
+        ) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        call_command('load_ingredients', file.name, batch_size=2,
+                     stdout=io.StringIO())
+
+    def test_load_json_is_idempotent(self):
+        """Повторная загрузка JSON не создаёт дубликатов."""
+        content = json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 'г'},
+            {'name': 'молоко', 'measurement_unit': 'мл'},
+        ])
+        self._load(content, '.json')
+        self._load(content, '.json')
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_load_csv(self):
+        """Ингредиенты загружаются из CSV с заголовком и без него."""
+        self._load('name,measurement_unit\nсоль,г\nсахар,г\n', '.csv')
+        self._load('соль,г\nмука,г\n', '.csv')
+        self.assertEqual(
+            list(Ingredient.objects.values_list('name', flat=True)),
+            ['мука', 'сахар', 'соль']
+        )
+
+    def test_load_json_without_field(self):
+        """Запись без обязательного поля даёт CommandError с её номером."""
+        content = json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'сахар'},
+        ])
+        with self.assertRaisesMessage(CommandError, 'Запись 2'):
+            self._load(content, '.json')
+
+    def test_load_synthetic(self):
+        """Синтетические ингредиенты генерируются в заданном количестве."""
+        call_command('load_ingredients', synthetic=25, batch_size=10,
+                     stdout=io.StringIO())
+        self.assertEqual(Ingredient.objects.count(), 25)
+
+
+class SeedAndBenchmarkTestCase(TestCase):
+    SEED_OPTIONS = {
+        'users': 20, 'recipes': 60, 'ingredients': 30, 'tags': 4,
+        'favorites': 100, 'carts': 40, 'subscriptions': 50,
+        'stdout': io.StringIO(),
+    }
+
+    def test_seed_is_consistent(self):
+        """Сгенерированные данные согласованы со счётчиками и списками."""
+        call_command('seed_foodgram', **self.SEED_OPTIONS)
+        self.assertEqual(Recipe.objects.count(), 60)
+        self.assertEqual(Favorite.objects.count(), 100)
+        self.assertEqual(Subscribe.objects.count(), 50)
+        self.assertFalse(Subscribe.objects.filter(
+            user=F('author')
+        ).exists())
+        self.assertEqual(counters.find_inconsistencies(), [])
+        self.assertEqual(shopping_list.find_inconsistencies(), [])
+
+    def test_benchmark_covers_actions_without_errors(self):
+        """Все сценарии замера отвечают без ошибок и откатываются."""
+        call_command('seed_foodgram', **self.SEED_OPTIONS)
+        out = io.StringIO()
+        call_command('benchmark_api', repeat=3, stdout=out)
+        rows = out.getvalue().splitlines()
+        self.assertGreater(len(rows), 20)
+        for row in rows:
+            self.assertNotIn('status=5', row)
+            self.assertNotIn('status=4', row)
+        self.assertEqual(Recipe.objects.count(), 60)
+
+
+def author_names_view(request):
+    return JsonResponse([
+        User.objects.get(pk=recipe.author_id).username
+        for recipe in Recipe.objects.all()
+    ], safe=False)
+
+
+urlpatterns = [path('n-plus-one/', author_names_view)]
+
+
+class RequestInstrumentationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'Рецепт {i}', text='Описание',
+                   cooking_time=10)
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_query_shape(self):
+        """Запросы, различающиеся только параметрами, имеют одну форму."""
+        self.assertEqual(
+            get_query_shape('SELECT * FROM t WHERE id IN (%s, %s) '
+                            'AND name = \'a\' LIMIT 21'),
+            get_query_shape('SELECT * FROM t WHERE id IN (%s)\n'
+                            'AND name = \'b\' LIMIT 1')
+        )
+
+    @override_settings(REQUEST_INSTRUMENTATION=True)
+    def test_server_timing_and_log(self):
+        """Включённый замер добавляет Server-Timing и пишет лог."""
+        with self.assertLogs('api.middleware', 'INFO') as logs:
+            response = self.client.get('/api/recipes/')
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="4 queries", app;dur=')
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'api:recipes-list')
+        self.assertEqual(record['queries'], 4)
+        self.assertIn('serialize_ms', record)
+        self.assertEqual(record['size'], len(response.content))
+        self.assertNotIn('repeated_queries', record)
+
+    @override_settings(REQUEST_INSTRUMENTATION=True,
+                       REQUEST_INSTRUMENTATION_REPEAT_THRESHOLD=2,
+                       ROOT_URLCONF='api.tests')
+    def test_repeated_queries_are_flagged(self):
+        """Повторяющийся по форме SQL помечается как N+1."""
+        with self.assertLogs('api.middleware', 'WARNING') as logs:
+            self.client.get('/n-plus-one/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['repeated_queries'][0]['count'], 3)
+
+    def test_serialization_timer(self):
+        """Вложенный serializer.data и запросы к БД внутри него не
+        учитываются дважды."""
+        collector = QueryCollector()
+        timer = SerializationTimer(collector)
+        with timer.measure():
+            time.sleep(0.02)
+            collector.duration += 0.015
+            with timer.measure():
+                time.sleep(0.01)
+        self.assertGreaterEqual(timer.duration, 0.015)
+        self.assertLess(timer.duration, 0.03)
+
+    def test_disabled_by_default(self):
+        """Без настройки заголовок не добавляется."""
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class IngredientSearchTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('сахар', 'сахарная пудра', 'ванильный сахар',
+                         'соль', 'мука')
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def _search(self, query, **params):
+        response = self.client.get('/api/ingredients/',
+                                   {'name': query, **params})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_matches_go_first(self):
+        """Совпадения по началу названия идут раньше вхождений."""
+        for backend in ('memory', 'database'):
+            with self.subTest(backend=backend), self.settings(
+                INGREDIENT_SEARCH_BACKEND=backend
+            ):
+                self.assertEqual(
+                    self._search('сах'),
+                    ['сахар', 'сахарная пудра', 'ванильный сахар']
+                )
+                self.assertEqual(self._search('сах', limit=1), ['сахар'])
+
+    def test_memory_search_ignores_case(self):
+        """Поиск в памяти не зависит от регистра."""
+        with self.settings(INGREDIENT_SEARCH_BACKEND='memory'):
+            self.assertEqual(self._search('МУ'), ['мука'])
+
+    def test_without_query_returns_all(self):
+        """Без строки поиска возвращаются все ингредиенты."""
+        self.assertEqual(len(self._search('')), 5)
+
+    def test_invalid_limit(self):
+        """Некорректный лимит возвращает ошибку."""
+        response = self.client.get('/api/ingredients/',
+                                   {'name': 'с', 'limit': 'abc'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_memory_index_sees_new_ingredients(self):
+        """Индекс в памяти обновляется при добавлении ингредиента."""
+        with self.settings(INGREDIENT_SEARCH_BACKEND='memory'):
+            self.assertEqual(self._search('мёд'), [])
+            Ingredient.objects.create(name='мёд', measurement_unit='г')
+            self.assertEqual(self._search('мёд'), ['мёд'])
+
+
+class CatalogCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', color='#FFFFFF',
+                                     slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tags_are_cached(self):
+        """Повторный запрос списка тегов не обращается к базе."""
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.json()[0]['slug'], 'breakfast')
+
+    def test_etag_returns_not_modified(self):
+        """Совпадающий ETag возвращает 304."""
+        response = self.client.get('/api/tags/')
+        self.assertIn('Last-Modified', response)
+        response = self.client.get('/api/tags/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_tag_change_invalidates_cache(self):
+        """Изменение тега сбрасывает кэш и меняет ETag."""
+        etag = self.client.get('/api/tags/')['ETag']
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()[0]['name'], 'Ужин')
+
+    def test_entry_built_before_commit_is_dropped(self):
+        """Запись, собранная между изменением тега и коммитом, после
+        коммита не используется."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.save()
+            catalog_cache.get_or_build('tags', None, lambda: 'до коммита')
+        entry = catalog_cache.get_or_build('tags', None,
+                                           lambda: 'после коммита')
+        self.assertEqual(entry['data'], 'после коммита')
+
+    def test_ingredient_search_is_cached_per_query(self):
+        """Результаты поиска ингредиентов кэшируются по строке запроса."""
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        self.client.get('/api/ingredients/', {'name': 'сол'})
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/', {'name': 'СОЛ '})
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['соль'])
+        response = self.client.get('/api/ingredients/', {'name': 'сах'})
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['сахар'])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeWriteQueriesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#FFFFFF',
+                                     slug='lunch')
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(50)
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def _payload(self, count):
+        return {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in self.ingredients[:count]
+            ],
+            'tags': [self.tag.pk],
+            'image': make_image_data(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def _count_queries(self, method, url, count):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(
+                url, self._payload(count), format='json'
+            )
+        self.assertIn(response.status_code,
+                      (HTTPStatus.OK, HTTPStatus.CREATED))
+        return len(context.captured_queries)
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        """Создание рецепта не делает запрос на каждый ингредиент."""
+        self.assertEqual(
+            self._count_queries('post', '/api/recipes/', 2),
+            self._count_queries('post', '/api/recipes/', 50)
+        )
+
+    def test_update_queries_do_not_depend_on_ingredients(self):
+        """Обновление рецепта не делает запрос на каждый ингредиент."""
+        recipe_id = self.client.post(
+            '/api/recipes/', self._payload(1), format='json'
+        ).json()['id']
+        url = f'/api/recipes/{recipe_id}/'
+        self.assertEqual(
+            self._count_queries('patch', url, 2),
+            self._count_queries('patch', url, 50)
+        )
+
+    def test_unknown_ingredients_return_bad_request(self):
+        """Несуществующие ингредиенты возвращают 400 со списком id."""
+        payload = self._payload(1)
+        payload['ingredients'] += [{'id': 100500, 'amount': 1},
+                                   {'id': 100501, 'amount': 1}]
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('100500, 100501', str(response.json()))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeUpdateTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color='#FFFFFF',
+                               slug=f'tag{i}')
+            for i in range(2)
+        ]
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+        self.recipe.tags.set([self.tags[0]])
+        self.items = IngredientsInRecipe.objects.bulk_create([
+            IngredientsInRecipe(recipe=self.recipe, ingredient=ingredient,
+                                amount=10)
+            for ingredient in self.ingredients[:2]
+        ])
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_partial_update_without_ingredients_and_tags(self):
+        """PATCH без ингредиентов и тегов меняет только переданные поля."""
+        response = self.client.patch(self.url, {'name': 'Новое название'},
+                                     format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.recipes.count(), 2)
+        self.assertEqual(list(self.recipe.tags.all()), [self.tags[0]])
+
+    def test_update_keeps_favorites_count(self):
+        """Добавление в избранное между чтением рецепта и PATCH не
+        теряется."""
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        reader_client = APIClient()
+        reader_client.force_authenticate(reader)
+        reader_client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        with mock.patch.object(RecipeViewSet, 'get_object',
+                               return_value=stale):
+            response = self.client.patch(
+                self.url, {'name': 'Новое название'}, format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_ingredients_diff(self):
+        """Изменяются только отличающиеся строки ингредиентов."""
+        response = self.client.patch(self.url, {'ingredients': [
+            {'id': self.ingredients[0].pk, 'amount': 10},
+            {'id': self.ingredients[1].pk, 'amount': 25},
+            {'id': self.ingredients[2].pk, 'amount': 5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        rows = {
+            item.ingredient_id: item
+            for item in IngredientsInRecipe.objects.filter(recipe=self.recipe)
+        }
+        self.assertEqual(rows[self.ingredients[0].pk].pk, self.items[0].pk)
+        self.assertEqual(rows[self.ingredients[1].pk].pk, self.items[1].pk)
+        self.assertEqual(rows[self.ingredients[1].pk].amount, 25)
+        self.assertEqual(rows[self.ingredients[2].pk].amount, 5)
+        response = self.client.patch(self.url, {'ingredients': [
+            {'id': self.ingredients[2].pk, 'amount': 5},
+        ]}, format='json')
+        self.assertEqual(
+            list(self.recipe.recipes.values_list('ingredient_id', flat=True)),
+            [self.ingredients[2].pk]
+        )
+
+    def test_unchanged_tags_are_not_rewritten(self):
+        """Неизменённые теги не перезаписываются."""
+        tags_table = Recipe.tags.through._meta.db_table
+        with CaptureQueriesContext(connection) as context:
+            self.client.patch(self.url, {'tags': [self.tags[0].pk]},
+                              format='json')
+        self.assertFalse([
+            query for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'DELETE'))
+            and tags_table in query['sql']
+        ])
+        self.client.patch(self.url, {'tags': [self.tags[1].pk]},
+                          format='json')
+        self.assertEqual(list(self.recipe.tags.all()), [self.tags[1]])
+
+
+class SubscriptionsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass'
+            ) for i in range(6)
+        ]
+        for number, author in enumerate(cls.authors):
+            Recipe.objects.bulk_create([
+                Recipe(author=author, name=f'Рецепт {number}-{i}',
+                       text='Описание', cooking_time=10)
+                for i in range(number + 1)
+            ])
+            Subscribe.objects.create(user=cls.user, author=author)
+        counters.reconcile()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _get(self, **params):
+        response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.json()['results']
+
+    def test_recipes_limit_and_count(self):
+        """Превью рецептов ограничено, а счётчик учитывает все рецепты."""
+        results = self._get(limit=6, recipes_limit=2)
+        for number, author in enumerate(results):
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], number + 1)
+            self.assertEqual(len(author['recipes']), min(number + 1, 2))
+        self.assertEqual(len(self._get(limit=6)[-1]['recipes']), 6)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        """Подписки загружаются за постоянное число запросов."""
+        counts = []
+        for limit in (2, 6):
+            with CaptureQueriesContext(connection) as context:
+                self._get(limit=limit, recipes_limit=3)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_recipes_limit(self):
+        """Нечисловой recipes_limit возвращает 400, а не 500."""
+        response = self.client.get('/api/users/subscriptions/',
+                                   {'recipes_limit': 'abc'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CountersTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#FFFFFF',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        self.clients = {}
+        for user in (self.user, self.author):
+            self.clients[user] = APIClient()
+            self.clients[user].force_authenticate(user)
+
+    def test_counters_follow_api_writes(self):
+        """Счётчики меняются вместе с рецептами, избранным и подписками."""
+        response = self.clients[self.author].post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 1}],
+            'tags': [self.tag.pk],
+            'image': make_image_data(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+        recipe_id = response.json()['id']
+        client = self.clients[self.user]
+        client.post(f'/api/recipes/{recipe_id}/favorite/')
+        client.post(f'/api/recipes/{recipe_id}/favorite/')
+        client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(Recipe.objects.get(pk=recipe_id).favorites_count, 1)
+
+        client.delete(f'/api/recipes/{recipe_id}/favorite/')
+        client.delete(f'/api/recipes/{recipe_id}/favorite/')
+        client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(Recipe.objects.get(pk=recipe_id).favorites_count, 0)
+        self.clients[self.author].delete(f'/api/recipes/{recipe_id}/')
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+        self.assertEqual(self.author.subscribers_count, 0)
+        self.assertEqual(counters.find_inconsistencies(), [])
+
+    def test_reconcile_command(self):
+        """Команда находит и исправляет разошедшиеся счётчики."""
+        recipe = Recipe.objects.create(author=self.author, name='Рецепт',
+                                       text='Описание', cooking_time=10)
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', check=True,
+                         stdout=io.StringIO())
+        call_command('reconcile_counters', stdout=io.StringIO())
+        call_command('reconcile_counters', check=True, stdout=io.StringIO())
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+
+
+class RecipeCursorPaginationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        Recipe.objects.bulk_create([
+            Recipe(author=cls.author, name=f'Рецепт {i}', text='Описание',
+                   cooking_time=10)
+            for i in range(7)
+        ])
+        first = Recipe.objects.order_by('id').first()
+        Recipe.objects.filter(id__lte=first.id + 3).update(
+            pub_date=first.pub_date
+        )
+
+    def _walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+            if len(ids) == 2:
+                Recipe.objects.create(author=self.author, name='Новый',
+                                      text='Описание', cooking_time=10)
+        return ids
+
+    def test_cursor_walks_all_recipes_once(self):
+        """Курсор проходит все рецепты без повторов и пропусков."""
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        self.assertEqual(
+            self._walk('/api/recipes/?pagination=cursor&limit=2'), expected
+        )
+
+    def test_page_mode_is_default(self):
+        """Без параметра pagination используется постраничный режим."""
+        response = self.client.get('/api/recipes/?limit=2&page=2')
+        self.assertEqual(response.json()['count'], 7)
+
+    def test_invalid_cursor(self):
+        """Неверный курсор возвращает 404."""
+        response = self.client.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class RecipeTagFilterTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.tags = Tag.objects.bulk_create([
+            Tag(name=slug, color='#FFFFFF', slug=slug)
+            for slug in ('breakfast', 'lunch', 'dinner')
+        ])
+        breakfast, lunch, dinner = cls.tags
+        cls.recipes = {}
+        for name, tags in (('all', cls.tags), ('two', (breakfast, lunch)),
+                           ('one', (dinner,)), ('none', ())):
+            recipe = Recipe.objects.create(author=cls.author, name=name,
+                                           text='Описание', cooking_time=10)
+            recipe.tags.set(tags)
+            cls.recipes[name] = recipe.pk
+
+    def setUp(self):
+        cache.clear()
+
+    def _get_names(self, query):
+        response = self.client.get(f'/api/recipes/?limit=10&{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = response.json()
+        names = [recipe['name'] for recipe in data['results']]
+        self.assertEqual(data['count'], len(names))
+        return sorted(names)
+
+    def test_any_and_all_modes(self):
+        """Рецепты не дублируются, режим all требует все теги."""
+        cases = (
+            ('tags=breakfast&tags=lunch', ['all', 'two']),
+            ('tags=breakfast&tags=lunch&tags=dinner', ['all', 'one', 'two']),
+            ('tags=breakfast&tags=lunch&tags_mode=all', ['all', 'two']),
+            ('tags=breakfast&tags=dinner&tags_mode=all', ['all']),
+            ('tags=breakfast&tags=breakfast&tags_mode=all', ['all', 'two']),
+        )
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(self._get_names(query), expected)
+
+    def test_invalid_params(self):
+        """Неизвестный тег или режим возвращают 400."""
+        for query in ('tags=brunch', 'tags=lunch&tags_mode=some'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+
+    def test_slug_map_is_not_a_tags_response(self):
+        """Служебная карта тегов не пересекается с ответами /api/tags/."""
+        response = self.client.get('/api/tags/?map=slug_to_id')
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(self._get_names('tags=lunch'), ['all', 'two'])
+        cache.clear()
+        self._get_names('tags=lunch')
+        response = self.client.get('/api/tags/?map=slug_to_id')
+        self.assertIsInstance(response.json(), list)
+
+    def test_no_join_per_tag(self):
+        """Фильтр по тегам не размножает JOIN и не читает теги заново."""
+        # Анонимные ответы кешируются целиком, смотрим запросы автора.
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.client.get('/api/recipes/?tags=lunch')
+        tags_table = Tag._meta.db_table
+        recipes_table = Recipe._meta.db_table
+        recipe_tags_table = Recipe.tags.through._meta.db_table
+        for query in ('tags=lunch',
+                      'tags=breakfast&tags=lunch&tags=dinner&tags_mode=all'):
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(f'/api/recipes/?{query}')
+            recipe_queries = [
+                captured['sql'] for captured in context.captured_queries
+                if f'FROM "{recipes_table}" ' in captured['sql']
+            ]
+            self.assertEqual(len(recipe_queries), 2)
+            for sql in recipe_queries:
+                self.assertNotIn(f'JOIN "{recipe_tags_table}"', sql)
+            for captured in context.captured_queries:
+                self.assertFalse(captured['sql'].startswith(
+                    f'SELECT "{tags_table}"."slug"'
+                ))
+
+
+class PopularRecipesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.fans = User.objects.bulk_create([
+            User(username=f'fan{i}', email=f'fan{i}@example.com')
+            for i in range(3)
+        ])
+        cls.recipes = Recipe.objects.bulk_create([
+            Recipe(author=cls.author, name=f'Рецепт {i}', text='Описание',
+                   cooking_time=10)
+            for i in range(4)
+        ])
+        old, fresh, carted, plain = cls.recipes
+        Recipe.objects.filter(pk=old.pk).update(
+            pub_date=old.pub_date - timedelta(days=60)
+        )
+        Favorite.objects.bulk_create(
+            [Favorite(user=fan, recipe=old) for fan in cls.fans]
+            + [Favorite(user=fan, recipe=fresh) for fan in cls.fans[:2]]
+        )
+        ShoppingCart.objects.create(user=cls.fans[0], recipe=carted)
+
+    def _get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_popular_ordering(self):
+        """Свежие рецепты из избранного выше старых и неотмеченных."""
+        call_command('refresh_recipe_scores', stdout=io.StringIO())
+        old, fresh, carted, plain = self.recipes
+        self.assertEqual(self._get_ids('/api/recipes/?ordering=popular'),
+                         [fresh.pk, carted.pk, old.pk, plain.pk])
+
+    def test_new_recipe_is_ranked_before_refresh(self):
+        """Рецепт из API сразу попадает в выдачу по популярности."""
+        call_command('refresh_recipe_scores', stdout=io.StringIO())
+        client = APIClient()
+        client.force_authenticate(self.author)
+        tag = Tag.objects.create(name='Обед', color='#FFFFFF', slug='lunch')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        with override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT):
+            recipe_id = client.post('/api/recipes/', {
+                'ingredients': [{'id': ingredient.pk, 'amount': 1}],
+                'tags': [tag.pk],
+                'image': make_image_data(),
+                'name': 'Новый',
+                'text': 'Описание',
+                'cooking_time': 10,
+            }, format='json').json()['id']
+        self.assertIn(recipe_id, self._get_ids(
+            '/api/recipes/?ordering=popular&limit=10'
+        ))
+
+    def test_orm_recipe_is_ranked_before_refresh(self):
+        """Рецепт, созданный в обход API, тоже сразу есть в выдаче."""
+        call_command('refresh_recipe_scores', stdout=io.StringIO())
+        recipe = Recipe.objects.create(
+            author=self.author, name='Из админки', text='Описание',
+            cooking_time=10
+        )
+        self.assertIn(recipe.pk, self._get_ids(
+            '/api/recipes/?ordering=popular&limit=10'
+        ))
+
+    def test_invalid_ordering(self):
+        """Неизвестная сортировка и курсор с popular дают 400."""
+        for url in ('/api/recipes/?ordering=likes',
+                    '/api/recipes/?ordering=popular&pagination=cursor'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, RECIPE_IMAGE_SYNC=True)
+class RecipeImageVariantsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#FFFFFF',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_variants_are_generated_on_create(self):
+        """При создании рецепта готовятся уменьшенные копии картинки."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 1}],
+                'tags': [self.tag.pk],
+                'image': make_image_data(size=(2000, 1000),
+                                         image_format='JPEG'),
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+            }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        thumbnail = recipe.image_variants['thumbnail']['webp']
+        with Image.open(os.path.join(TEMP_MEDIA_ROOT, thumbnail)) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (320, 160))
+            self.assertNotIn('exif', image.info)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertTrue(
+            response.json()['image_variants']['medium']['jpeg'].endswith(
+                recipe.image_variants['medium']['jpeg']
+            )
+        )
+
+    def test_old_variants_are_deleted(self):
+        """Копии старой картинки удаляются при её замене и при удалении
+        рецепта."""
+        def variant_paths(recipe_id):
+            recipe = Recipe.objects.get(pk=recipe_id)
+            return [
+                os.path.join(TEMP_MEDIA_ROOT, name)
+                for files in recipe.image_variants.values()
+                for name in files.values()
+            ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.client.post('/api/recipes/', {
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 1}],
+                'tags': [self.tag.pk],
+                'image': make_image_data(size=(400, 400)),
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+            }, format='json').json()['id']
+        old_paths = variant_paths(recipe_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/',
+                {'image': make_image_data(size=(500, 500))}, format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        new_paths = variant_paths(recipe_id)
+        self.assertEqual(len(new_paths), 4)
+        self.assertFalse(any(map(os.path.exists, old_paths)))
+        self.assertTrue(all(map(os.path.exists, new_paths)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/recipes/{recipe_id}/')
+        self.assertFalse(any(map(os.path.exists, new_paths)))
+
+    def test_backfill_command(self):
+        """Команда готовит копии для рецептов без них."""
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+        image = make_image_data(size=(400, 400))
+        recipe.image.save(
+            'old.png', ContentFile(base64.b64decode(image.split(',')[1]))
+        )
+        call_command('generate_image_variants', workers=1,
+                     stdout=io.StringIO())
+        recipe.refresh_from_db()
+        self.assertEqual(set(recipe.image_variants), {'thumbnail', 'medium'})
+
+
+class StreamingBase64ImageFieldTestCase(TestCase):
+
+    def test_valid_image(self):
+        """Корректная картинка раскодируется в файл."""
+        field = StreamingBase64ImageField()
+        value = field.to_internal_value(make_image_data(size=(300, 200),
+                                                        image_format='JPEG'))
+        self.assertTrue(value.name.endswith('.jpg'))
+        with Image.open(value) as image:
+            self.assertEqual(image.size, (300, 200))
+
+    def test_limits(self):
+        """Большие, слишком детальные и чужие форматы отклоняются."""
+        cases = (
+            (StreamingBase64ImageField(max_bytes=100),
+             make_image_data(size=(300, 300)), 'too_large'),
+            (StreamingBase64ImageField(max_pixels=100),
+             make_image_data(size=(20, 20)), 'too_many_pixels'),
+            (StreamingBase64ImageField(formats=('PNG',)),
+             make_image_data(image_format='JPEG'), 'invalid_format'),
+            (StreamingBase64ImageField(),
+             'data:image/png;base64,не base64', 'invalid_base64'),
+            (StreamingBase64ImageField(), 'картинка', 'invalid_data_uri'),
+        )
+        for field, data, code in cases:
+            with self.subTest(code=code):
+                with self.assertRaises(ValidationError) as context:
+                    field.to_internal_value(data)
+                self.assertEqual(context.exception.detail[0].code, code)
+
+    def test_decompression_bomb(self):
+        """Заголовок с огромными размерами даёт too_many_pixels, а не 500."""
+        def chunk(kind, body):
+            return (struct.pack('>I', len(body)) + kind + body
+                    + struct.pack('>I', zlib.crc32(kind + body)))
+
+        png = (b'\x89PNG\r\n\x1a\n'
+               + chunk(b'IHDR', struct.pack('>IIBBBBB', 30000, 20000,
+                                            8, 2, 0, 0, 0))
+               + chunk(b'IDAT', zlib.compress(b''))
+               + chunk(b'IEND', b''))
+        data = 'data:image/png;base64,' + base64.b64encode(png).decode()
+        with self.assertRaises(ValidationError) as context:
+            StreamingBase64ImageField().to_internal_value(data)
+        self.assertEqual(context.exception.detail[0].code, 'too_many_pixels')
+
+    def test_line_wrapped_base64(self):
+        """base64 с переносами строк длиннее куска декодирования
+        принимается."""
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3)).save(
+            buffer, 'PNG'
+        )
+        data = 'data:image/png;base64,' + base64.encodebytes(
+            buffer.getvalue()
+        ).decode().replace('\n', '\r\n')
+        value = StreamingBase64ImageField().to_internal_value(data)
+        self.assertEqual(value.read(), buffer.getvalue())
+
+    def test_zero_limit(self):
+        """Нулевой лимит не заменяется значением по умолчанию."""
+        with self.assertRaises(ValidationError) as context:
+            StreamingBase64ImageField(max_bytes=0).to_internal_value(
+                make_image_data()
+            )
+        self.assertEqual(context.exception.detail[0].code, 'too_large')
+
+    def test_format_mismatch(self):
+        """Формат определяется по содержимому, а не по заголовку."""
+        field = StreamingBase64ImageField(formats=('PNG',))
+        data = make_image_data(image_format='JPEG').replace('image/jpeg',
+                                                            'image/png')
+        with self.assertRaises(ValidationError):
+            field.to_internal_value(data)
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+
+    def setUp(self):
+        reset_token_cache()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def get_token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            query['sql'] for query in context.captured_queries
+            if Token._meta.db_table in query['sql']
+            or f'FROM "{User._meta.db_table}"' in query['sql']
+        ]
+
+    def test_token_is_cached(self):
+        """Повторный запрос не читает ни токен, ни пользователя."""
+        self.assertEqual(len(self.get_token_queries()), 1)
+        self.assertEqual(self.get_token_queries(), [])
+
+    def test_cached_user_save_keeps_password(self):
+        """Пользователь из кеша не затирает пароль, сменённый после того,
+        как токен попал в кеш."""
+        self.get_token_queries()
+        self.user.set_password('New-pass-123')
+        User.objects.filter(pk=self.user.pk).update(
+            password=self.user.password
+        )
+        user, _ = CachedTokenAuthentication().authenticate_credentials(
+            self.token.key
+        )
+        user.first_name = 'Иван'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Иван')
+        self.assertTrue(self.user.check_password('New-pass-123'))
+
+    def test_logout_invalidates_cache(self):
+        """После выхода токен из кеша не принимается."""
+        self.get_token_queries()
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_user_save_keeps_counters(self):
+        """Сохранение пользователя не затирает счётчики, изменённые
+        после того, как токен попал в кеш."""
+        self.get_token_queries()
+        User.objects.filter(pk=self.user.pk).update(recipes_count=5)
+        response = self.client.post(
+            '/api/users/set_password/',
+            {'current_password': 'pass', 'new_password': 'New-pass-123'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 5)
+        self.assertTrue(self.user.check_password('New-pass-123'))
+
+    def test_deactivation_invalidates_cache(self):
+        """Деактивированный пользователь сразу теряет доступ."""
+        self.get_token_queries()
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class UserStateTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.recipes = Recipe.objects.bulk_create([
+            Recipe(author=cls.author, name=f'Рецепт {i}', text='Описание',
+                   cooking_time=10)
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+
+    def test_state(self):
+        """Состояние отдаётся отсортированными списками id."""
+        for recipe in reversed(self.recipes):
+            self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipes[1].pk}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        response = self.client.get('/api/users/me/state/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json(), {
+            'favorites': [recipe.pk for recipe in self.recipes],
+            'shopping_cart': [self.recipes[1].pk],
+            'subscriptions': [self.author.pk],
+        })
+
+    def test_not_modified(self):
+        """Неизменившееся состояние отдаётся как 304 за один запрос."""
+        etag = self.client.get('/api/users/me/state/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/me/state/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_version_is_bumped(self):
+        """Добавление, удаление и удаление рецепта автором меняют ETag."""
+        recipe = self.recipes[0]
+        changes = (
+            lambda: self.client.post(f'/api/recipes/{recipe.pk}/favorite/'),
+            lambda: self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            ),
+            lambda: self.client.delete(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            ),
+            lambda: self.client.post(
+                f'/api/users/{self.author.pk}/subscribe/'
+            ),
+            lambda: self.author_client.delete(f'/api/recipes/{recipe.pk}/'),
+        )
+        etag = self.client.get('/api/users/me/state/')['ETag']
+        for change in changes:
+            change()
+            response = self.client.get('/api/users/me/state/',
+                                       HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            etag = response['ETag']
+        self.assertEqual(response.json()['favorites'], [])
+
+    def test_stale_user_save_keeps_version(self):
+        """Сохранение устаревшего объекта пользователя (смена пароля) не
+        возвращает старую версию состояния."""
+        etag = self.client.get('/api/users/me/state/')['ETag']
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.client.post(f'/api/recipes/{self.recipes[0].pk}/favorite/')
+        response = self.client.post(
+            '/api/users/set_password/',
+            {'current_password': 'pass', 'new_password': 'New-pass-123'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        response = self.client.get('/api/users/me/state/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['subscriptions'], [self.author.pk])
+
+    def test_missing_delete_keeps_version(self):
+        """Удаление отсутствующей записи версию не меняет."""
+        etag = self.client.get('/api/users/me/state/')['ETag']
+        self.client.delete(f'/api/recipes/{self.recipes[0].pk}/favorite/')
+        response = self.client.get('/api/users/me/state/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_anonymous(self):
+        """Состояние доступно только авторизованным."""
+        response = APIClient().get('/api/users/me/state/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class AnonymousResponseCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#FFFFFF',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+        cls.recipe, cls.other = Recipe.objects.bulk_create([
+            Recipe(author=cls.author, name=f'Рецепт {i}', text='Описание',
+                   cooking_time=10)
+            for i in range(2)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.list_url = '/api/recipes/?limit=6&author={0}'.format(
+            self.author.pk
+        )
+        self.detail_url = f'/api/recipes/{self.recipe.pk}/'
+
+    def assertCache(self, url, expected):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['X-Cache'], expected)
+        return response
+
+    def test_hit(self):
+        """Повторный анонимный запрос отдаётся из кеша без запросов к БД."""
+        self.assertCache(self.list_url, 'MISS')
+        self.assertCache(self.detail_url, 'MISS')
+        with self.assertNumQueries(0):
+            self.assertCache(
+                f'/api/recipes/?author={self.author.pk}&limit=6', 'HIT'
+            )
+            self.assertCache(self.detail_url, 'HIT')
+        self.assertEqual(
+            response_cache.get_stats(),
+            {'hits': 2, 'misses': 2, 'hit_ratio': 0.5}
+        )
+
+    def test_invalidation(self):
+        """Изменения рецепта, его тегов, ингредиентов и автора видны сразу."""
+        changes = (
+            lambda: Recipe.objects.get(pk=self.recipe.pk).save(),
+            lambda: self.recipe.tags.add(self.tag),
+            lambda: IngredientsInRecipe.objects.create(
+                recipe=self.recipe, ingredient=self.ingredient, amount=5
+            ),
+            lambda: self.tag.save(),
+            lambda: User.objects.get(pk=self.author.pk).save(),
+        )
+        for change in changes:
+            self.assertCache(self.list_url, 'MISS')
+            self.assertCache(self.detail_url, 'MISS')
+            self.assertCache(self.detail_url, 'HIT')
+            change()
+        self.assertCache(self.list_url, 'MISS')
+        self.assertCache(self.detail_url, 'MISS')
+
+    def test_reverse_tag_clear(self):
+        """Очистка рецептов у тега сбрасывает карточки этих рецептов."""
+        self.recipe.tags.add(self.tag)
+        self.assertCache(self.detail_url, 'MISS')
+        self.tag.recipe_set.clear()
+        response = self.assertCache(self.detail_url, 'MISS')
+        self.assertEqual(response.json()['tags'], [])
+
+    def test_equivalent_detail_urls(self):
+        """Карточка по id с ведущим нулём сбрасывается вместе с рецептом."""
+        url = f'/api/recipes/0{self.recipe.pk}/'
+        self.assertCache(url, 'MISS')
+        self.assertCache(url, 'HIT')
+        Recipe.objects.get(pk=self.recipe.pk).save()
+        self.assertCache(url, 'MISS')
+
+    def test_fine_grained(self):
+        """Изменение другого рецепта или вход автора не сбрасывают карточку."""
+        self.assertCache(self.detail_url, 'MISS')
+        Recipe.objects.get(pk=self.other.pk).save()
+        User.objects.get(pk=self.author.pk).save(update_fields=['last_login'])
+        self.assertCache(self.detail_url, 'HIT')
+        self.assertCache(self.list_url, 'MISS')
+
+    def test_not_cached(self):
+        """Ошибки и ответы авторизованным не кешируются."""
+        for _ in range(2):
+            response = self.client.get('/api/recipes/0/')
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(response_cache.get_stats()['hits'], 0)
+        response = self.client.get('/api/recipes/abc/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertNotIn('X-Cache', response)
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.get(self.detail_url)
+        self.assertNotIn('X-Cache', response)
+
+
+class BulkFavoriteShoppingCartTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='pass'
+        )
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        cls.recipes = Recipe.objects.bulk_create([
+            Recipe(author=cls.author, name=f'Рецепт {i}', text='Описание',
+                   cooking_time=10)
+            for i in range(10)
+        ])
+        IngredientsInRecipe.objects.bulk_create([
+            IngredientsInRecipe(recipe=recipe, ingredient=salt,
+                                amount=index + 1)
+            for index, recipe in enumerate(cls.recipes)
+        ])
+        counters.reconcile()
+        cls.ids = [recipe.pk for recipe in cls.recipes]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _send(self, method, url, recipe_ids):
+        response = getattr(self.client, method)(
+            url, {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return {
+            result['id']: result['status']
+            for result in response.json()['results']
+        }
+
+    def _salt(self):
+        return ShoppingListItem.objects.filter(user=self.user).values_list(
+            'total_amount', flat=True
+        ).first()
+
+    def test_shopping_cart(self):
+        """Корзина пополняется и очищается списком, статус у каждого id."""
+        first, second, third = self.ids[:3]
+        url = '/api/recipes/shopping_cart/'
+        self.assertEqual(
+            self._send('post', url, [first, second, 10 ** 6, first]),
+            {first: 'added', second: 'added', 10 ** 6: 'not_found'}
+        )
+        self.assertEqual(self._salt(), 3)
+        self.assertEqual(
+            self._send('post', url, [second, third]),
+            {second: 'exists', third: 'added'}
+        )
+        self.assertEqual(self._salt(), 6)
+        self.assertEqual(
+            self._send('delete', url, [first, self.ids[5]]),
+            {first: 'removed', self.ids[5]: 'absent'}
+        )
+        self.assertEqual(self._salt(), 5)
+        self.assertEqual(shopping_list.find_inconsistencies(), [])
+
+    def test_favorite(self):
+        """Массовое избранное обновляет счётчики рецептов."""
+        url = '/api/recipes/favorite/'
+        self._send('post', url, self.ids[:4])
+        self._send('delete', url, self.ids[2:6])
+        self.assertEqual(
+            set(Favorite.objects.filter(user=self.user).values_list(
+                'recipe_id', flat=True
+            )),
+            set(self.ids[:2])
+        )
+        self.assertEqual(counters.find_inconsistencies(), [])
+
+    def test_queries_do_not_depend_on_size(self):
+        """Число запросов не растёт с числом рецептов."""
+        url = '/api/recipes/shopping_cart/'
+        # Первый рецепт остаётся в корзине, чтобы позиция списка покупок
+        # уже существовала в обоих замерах.
+        self._send('post', url, self.ids[:1])
+        for method in ('post', 'delete'):
+            with CaptureQueriesContext(connection) as few:
+                self._send(method, url, self.ids[1:3])
+            with CaptureQueriesContext(connection) as many:
+                self._send(method, url, self.ids[3:])
+            with self.subTest(method=method):
+                self.assertEqual(len(few), len(many))
+
+    def test_clear_shopping_cart(self):
+        """Очистка корзины удаляет и рецепты, и список покупок."""
+        self._send('post', '/api/recipes/shopping_cart/', self.ids)
+        response = self.client.post('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertFalse(ShoppingCart.objects.filter(user=self.user).exists())
+        self.assertIsNone(self._salt())
+
+    def test_invalid_payload(self):
+        """Пустой, слишком длинный или неверный список отклоняется."""
+        for recipe_ids in ([], list(range(1, 102)), ['рецепт'], [-1]):
+            with self.subTest(recipe_ids=recipe_ids[:3]):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'recipes': recipe_ids},
+                    format='json'
+                )
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+
+
+class IdempotentWritesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(author=cls.author, name='Рецепт',
+                                           text='Описание', cooking_time=10)
+        counters.reconcile()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_writes(self):
+        """Повторное добавление возвращает 400, а не ошибку БД."""
+        for url in (f'/api/recipes/{self.recipe.pk}/favorite/',
+                    f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+                    f'/api/users/{self.author.pk}/subscribe/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code,
+                                 HTTPStatus.CREATED)
+                self.assertEqual(self.client.post(url).status_code,
+                                 HTTPStatus.BAD_REQUEST)
+        self.assertEqual(counters.find_inconsistencies(), [])
+
+    def test_self_subscription(self):
+        """Подписка на себя отклоняется до обращения к БД."""
+        for pk in (self.user.pk, f'0{self.user.pk}'):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(f'/api/users/{pk}/subscribe/')
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+            self.assertFalse(any(
+                table in query['sql']
+                for query in context.captured_queries
+                for table in (User._meta.db_table, Subscribe._meta.db_table)
+            ))
+
+
+@skipIf(connection.vendor == 'sqlite',
+        'SQLite не допускает параллельной записи')
+class ConcurrentWritesTestCase(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        self.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+        IngredientsInRecipe.objects.create(
+            recipe=self.recipe,
+            ingredient=Ingredient.objects.create(name='Соль',
+                                                 measurement_unit='г'),
+            amount=5
+        )
+        counters.reconcile()
+
+    def hammer(self, method, url, urls=None):
+        urls = urls or [url] * self.THREADS
+        barrier = threading.Barrier(len(urls))
+
+        def send(url):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(len(urls)) as executor:
+            return sorted(executor.map(send, urls))
+
+    def test_same_pair(self):
+        """Параллельные запросы с одной парой: ровно одна запись."""
+        created = ([HTTPStatus.CREATED]
+                   + [HTTPStatus.BAD_REQUEST] * (self.THREADS - 1))
+        for url in (f'/api/recipes/{self.recipe.pk}/favorite/',
+                    f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+                    f'/api/users/{self.author.pk}/subscribe/'):
+            for _ in range(self.ROUNDS):
+                with self.subTest(url=url):
+                    self.assertEqual(self.hammer('post', url), created)
+                    self.assertEqual(counters.find_inconsistencies(), [])
+                    self.assertEqual(shopping_list.find_inconsistencies(),
+                                     [])
+                    self.assertEqual(
+                        self.hammer('delete', url),
+                        [HTTPStatus.NO_CONTENT] * self.THREADS
+                    )
+                    self.assertEqual(counters.find_inconsistencies(), [])
+                    self.assertEqual(shopping_list.find_inconsistencies(),
+                                     [])
+
+    def test_shared_ingredient(self):
+        """Разные рецепты с общим ингредиентом складываются в один список."""
+        salt = Ingredient.objects.get()
+        recipes = Recipe.objects.bulk_create([
+            Recipe(author=self.author, name=f'Рецепт {i}',
+                   text='Описание', cooking_time=10)
+            for i in range(self.THREADS)
+        ])
+        IngredientsInRecipe.objects.bulk_create([
+            IngredientsInRecipe(recipe=recipe, ingredient=salt, amount=1)
+            for recipe in recipes
+        ])
+        urls = [f'/api/recipes/{recipe.pk}/shopping_cart/'
+                for recipe in recipes]
+        self.assertEqual(self.hammer('post', None, urls),
+                         [HTTPStatus.CREATED] * self.THREADS)
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).total_amount,
+            self.THREADS
+        )
@@ -1,23 +1,30 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 
-from rest_framework import filters, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
 
-from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
-                            ShoppingCart, Tag)
-from services.build_shopping_cart_file import BuildShoppingCartFileService
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from services import counters, shopping_list, user_state
+from services.build_shopping_cart_file import SHOPPING_CART_FILE_SERVICES
 from users.models import Subscribe, User
-from .filters import RecipeFilter
-from .mixins import SubscribeFavoriteShoppingCartMixin
-from .pagination import CustomPagination
+from .filters import IngredientSearchFilter, RecipeFilter
+from .mixins import (AnonymousResponseCacheMixin, CatalogCacheMixin,
+                     SubscribeFavoriteShoppingCartMixin)
+from .pagination import CustomPagination, RecipeFeedPagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (IngredientSerializer, RecipeWriteSerializer,
                           RecipeGetSerializer, SubscriptionSerializer,
-                          TagSerializer)
+                          SubscriptionsQuerySerializer, TagSerializer)
 
 
 class CustomUserViewSet(UserViewSet, SubscribeFavoriteShoppingCartMixin):
@@ -29,8 +36,28 @@ class CustomUserViewSet(UserViewSet, SubscribeFavoriteShoppingCartMixin):
             permission_classes=(IsAuthenticated,),
             pagination_class=CustomPagination)
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscribing__user=request.user)
+        query_serializer = SubscriptionsQuerySerializer(
+            data=request.query_params
+        )
+        query_serializer.is_valid(raise_exception=True)
+        recipes_limit = query_serializer.validated_data.get('recipes_limit')
+        queryset = User.objects.filter(
+            subscribing__user=request.user
+        ).order_by('id')
         page = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.all()
+        if recipes_limit is not None:
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author'),
+                    order_by=(F('pub_date').desc(), F('id').desc())
+                )
+            ).filter(row_number__lte=recipes_limit)
+        prefetch_related_objects(
+            page, Prefetch('recipes', queryset=recipes,
+                           to_attr='recent_recipes')
+        )
         serializer = SubscriptionSerializer(
             page,
             many=True,
@@ -38,6 +65,44 @@ class CustomUserViewSet(UserViewSet, SubscribeFavoriteShoppingCartMixin):
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='me/state',
+            permission_classes=(IsAuthenticated,))
+    def me_state(self, request):
+        etag = quote_etag('{0}-{1}'.format(
+            request.user.pk, user_state.get_version(request.user)
+        ))
+        conditional_response = get_conditional_response(request, etag=etag)
+        if conditional_response is not None:
+            response = Response(status=conditional_response.status_code)
+        else:
+            response = Response(user_state.get_state(request.user))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        recipes = Recipe.objects.filter(author=instance)
+        user_state.bump_versions(
+            user_state.get_recipe_user_ids(recipes).union(
+                user_state.get_subscriber_ids(instance)
+            )
+        )
+        # Каскадное удаление идёт в обход сервисов: списки покупок других
+        # пользователей и счётчики поправляем заранее.
+        shopping_list.delete_recipes(recipes)
+        counters.change_favorites_many(
+            Favorite.objects.filter(user=instance).exclude(
+                recipe__author=instance
+            ).values_list('recipe_id', flat=True), -1
+        )
+        counters.change_subscribers_many(
+            Subscribe.objects.filter(user=instance).values_list(
+                'author_id', flat=True
+            ), -1
+        )
+        super().perform_destroy(instance)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, id=None):
@@ -47,19 +112,30 @@ class CustomUserViewSet(UserViewSet, SubscribeFavoriteShoppingCartMixin):
             return self.delete_method(User, Subscribe, id, request)
 
 
-class RecipeViewSet(viewsets.ModelViewSet, SubscribeFavoriteShoppingCartMixin):
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet,
+                    SubscribeFavoriteShoppingCartMixin):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrReadOnly]
-    pagination_class = CustomPagination
+    pagination_class = RecipeFeedPagination
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'create', 'delete']
 
+    def get_queryset(self):
+        return Recipe.objects.with_related(self.request.user)
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeGetSerializer
         return RecipeWriteSerializer
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        shopping_list.delete_recipe(instance)
+        counters.change_recipes(instance.author, -1)
+        user_state.bump_versions(user_state.get_recipe_user_ids([instance]))
+        instance.delete()
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk=None):
@@ -77,33 +153,63 @@ class RecipeViewSet(viewsets.ModelViewSet, SubscribeFavoriteShoppingCartMixin):
         elif request.method == 'DELETE':
             return self.delete_method(Recipe, ShoppingCart, pk, request)
 
+    @action(detail=False, methods=['post', 'delete'], url_path='favorite',
+            url_name='favorite-bulk', permission_classes=(IsAuthenticated,))
+    def favorite_bulk(self, request):
+        return self.bulk_method(Favorite, request)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart', url_name='shopping-cart-bulk',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_bulk(self, request):
+        return self.bulk_method(ShoppingCart, request)
+
+    @action(detail=False, methods=['post'], url_path='shopping_cart/clear',
+            permission_classes=(IsAuthenticated,))
+    def clear_shopping_cart(self, request):
+        return self.clear_shopping_cart_method(request.user)
+
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request, **kwargs):
-        recipes_ids = ShoppingCart.objects.filter(
-            user=request.user).values_list('recipe_id')
-        ingredients = IngredientsInRecipe.objects.filter(
-            recipe__in=recipes_ids).values('ingredient__name',
-                                           'ingredient__measurement_unit'
-                                           ).annotate(amount=Sum('amount'))
-
-        service = BuildShoppingCartFileService(ingredients)
-        response = HttpResponse(service.final_list, content_type='text/plain')
+        file_format = request.query_params.get('file_format', 'txt')
+        service_class = SHOPPING_CART_FILE_SERVICES.get(file_format)
+        if service_class is None:
+            return Response(
+                {'file_format': [
+                    'Доступные форматы: {0}'.format(
+                        ', '.join(SHOPPING_CART_FILE_SERVICES)
+                    )
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            amount=F('total_amount')
+        ).order_by('ingredient__name')
+
+        service = service_class(ingredients.iterator())
+        response = StreamingHttpResponse(
+            service, content_type=service.content_type
+        )
         response['Content-Disposition'] = (
             'attachment; filename={0}'.format(service.filename)
         )
         return response
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalog = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalog = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter, )
-    search_fields = ('^name', )
+    filter_backends = (IngredientSearchFilter, )
     pagination_class = None
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,34 @@ DATABASES = {
     }
 }
 
+# По умолчанию кэш в памяти процесса (LRU); для нескольких воркеров
+# задайте общий бэкенд, например
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+    }
+
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Кеш ответов списка и карточки рецепта для анонимных пользователей.
+# С LocMemCache у каждого процесса свой кеш и свои версии, поэтому
+# изменения в других процессах видны не позже чем через таймаут
+RECIPE_RESPONSE_CACHE_ALIAS = 'default'
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', 60)
+)
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -103,7 +132,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -152,3 +181,68 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 
 AUTH_USER_MODEL = 'users.User'
+
+# Поиск ингредиентов: database (индексы PostgreSQL) или memory
+# (префиксный индекс в памяти процесса); по умолчанию выбирается по СУБД
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND')
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+
+# Ограничения на картинки рецептов, проверяются до полного декодирования
+RECIPE_IMAGE_MAX_BYTES = int(os.getenv('RECIPE_IMAGE_MAX_BYTES',
+                                       10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS',
+                                        40_000_000))
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+# Уменьшенные копии картинок рецептов готовятся в пуле потоков после
+# сохранения рецепта; RECIPE_IMAGE_SYNC=1 делает это прямо в запросе
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_SYNC = os.getenv('RECIPE_IMAGE_SYNC', '') == '1'
+
+# Рейтинг для ordering=popular пересчитывается командой
+# refresh_recipe_scores (например, по cron раз в несколько минут)
+RECIPE_SCORE_CART_WEIGHT = 0.5
+RECIPE_SCORE_HALF_LIFE_DAYS = 14
+
+# Сколько рецептов можно передать в одном массовом добавлении
+# в избранное или корзину
+RECIPES_BULK_LIMIT = 100
+
+# Кеш токен -> пользователь для CachedTokenAuthentication: LRU в памяти
+# процесса или, если задан TOKEN_AUTH_CACHE_ALIAS, общий кеш Django
+# (тогда выход и деактивация сразу видны всем процессам)
+TOKEN_AUTH_CACHE_ALIAS = os.getenv('TOKEN_AUTH_CACHE_ALIAS')
+TOKEN_AUTH_CACHE_SIZE = 10000
+TOKEN_AUTH_CACHE_TIMEOUT = int(os.getenv('TOKEN_AUTH_CACHE_TIMEOUT', 300))
+
+# Замер запросов к БД и времени ответа: заголовок Server-Timing и лог
+# api.middleware; одинаковый по форме SQL больше THRESHOLD раз за запрос
+# считается N+1 и пишется с уровнем WARNING
+REQUEST_INSTRUMENTATION = os.getenv('REQUEST_INSTRUMENTATION', '') == '1'
+REQUEST_INSTRUMENTATION_REPEAT_THRESHOLD = int(
+    os.getenv('REQUEST_INSTRUMENTATION_REPEAT_THRESHOLD', 5)
+)
+
+# Без этого INFO-записи замеров отбрасываются: по умолчанию Django
+# выводит только логгер django. В боевых настройках пишется корневой логгер.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.middleware': {
+            'handlers': ['console'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# Путь к TTF-шрифту с кириллицей для выгрузки списка покупок в PDF
+# (в образе ставится пакет fonts-dejavu-core); без него формат pdf недоступен
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
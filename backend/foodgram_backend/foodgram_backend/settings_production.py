@@ -0,0 +1,54 @@
+# Настройки для боевого запуска, включаются в Dockerfile через
+# DJANGO_SETTINGS_MODULE=foodgram_backend.settings_production
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import ALLOWED_HOSTS, CACHES, DATABASES, SECRET_KEY
+
+# При DEBUG Django хранит текст каждого SQL-запроса в connection.queries.
+DEBUG = False
+
+SECRET_KEY = os.getenv('SECRET_KEY', SECRET_KEY)
+
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', ','.join(ALLOWED_HOSTS)).split(',')
+
+# DB_PGBOUNCER=1 — база доступна через pgbouncer в режиме transaction
+# pooling: серверные курсоры (QuerySet.iterator()) не переживают смену
+# серверного соединения, а держать соединения открытыми в Django не нужно.
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', '') == '1'
+
+# Постоянные соединения с проверкой перед повторным использованием.
+# Под ASGI (uvicorn) соединения не переиспользуются между запросами,
+# там нужен пул вроде pgbouncer.
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.getenv('CONN_MAX_AGE', 0 if DB_PGBOUNCER else 60)
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = DB_PGBOUNCER
+
+# Воркеры gunicorn — отдельные процессы: версии справочников, кеш ответов
+# и ETag должны быть общими, иначе изменения, сделанные в одном воркере,
+# другие увидят только по истечении таймаута. gunicorn.conf.py не
+# запустит несколько воркеров с LocMemCache.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'
+)
+if not CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default'] = {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://redis:6379/0'),
+    }
+    # Выход из аккаунта должен сразу сбрасывать токен во всех воркерах.
+    TOKEN_AUTH_CACHE_ALIAS = os.getenv('TOKEN_AUTH_CACHE_ALIAS', 'default')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.getenv('LOG_LEVEL', 'INFO'),
+    },
+}
@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+
+
+def cpu_count():
+    """Число доступных процессу ядер с учётом ограничений контейнера."""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = multiprocessing.cpu_count()
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != 'max':
+            count = min(count, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:2000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class.startswith('uvicorn'):
+    # Запросы идут через ASGI-приложение Django; воркеры однопоточные.
+    wsgi_app = 'foodgram_backend.asgi:application'
+    workers = int(os.getenv('WEB_CONCURRENCY', cpu_count() + 1))
+    threads = 1
+else:
+    wsgi_app = 'foodgram_backend.wsgi:application'
+    workers = int(os.getenv('WEB_CONCURRENCY', cpu_count() * 2 + 1))
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = timeout
+keepalive = 5
+# Перезапуск воркеров ограничивает рост памяти; разброс не даёт им
+# перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+
+def on_starting(server):
+    # Кеш в памяти процесса у каждого воркера свой: сброс версий в одном
+    # воркере не виден остальным.
+    from django.conf import settings
+
+    backend = settings.CACHES['default']['BACKEND']
+    if server.cfg.workers > 1 and backend.endswith('LocMemCache'):
+        raise RuntimeError(
+            'LocMemCache нельзя использовать с несколькими воркерами: '
+            'задайте CACHE_BACKEND и CACHE_LOCATION (например, Redis) '
+            'или WEB_CONCURRENCY=1'
+        )
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            RecipeScore, ShoppingCart, ShoppingListItem, Tag)
 
 
 class IngredientsInline(admin.TabularInline):
@@ -19,15 +19,12 @@ class RecipeAdmin(admin.ModelAdmin):
         'image',
         'text',
         'cooking_time',
-        'in_favorites'
+        'favorites_count'
     )
     list_filter = ('name', 'author', 'tags')
     search_fields = ('name', 'author', 'tags')
     inlines = (IngredientsInline,)
 
-    def in_favorites(self, obj):
-        return obj.favorite_recipe.count()
-
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -61,3 +58,17 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'recipe')
     list_filter = ('recipe', 'user')
     search_fields = ('user', )
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'ingredient', 'total_amount')
+    list_filter = ('user', )
+    search_fields = ('user__username', )
+
+
+@admin.register(RecipeScore)
+class RecipeScoreAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'score', 'favorites_count',
+                    'shopping_carts_count', 'updated_at')
+    search_fields = ('recipe__name', )
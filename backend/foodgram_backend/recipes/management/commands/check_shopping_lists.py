@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from services import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Сверяет списки покупок пользователей с их корзинами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users', help='id пользователя')
+
+    def handle(self, *args, **options):
+        problems = shopping_list.find_inconsistencies(options['users'])
+        for user_id, ingredient_id, expected, actual in problems:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'ожидалось {expected}, в таблице {actual}'
+            )
+        if problems:
+            raise CommandError(
+                f'Расхождений: {len(problems)}. '
+                'Запустите rebuild_shopping_lists.'
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок согласованы'))
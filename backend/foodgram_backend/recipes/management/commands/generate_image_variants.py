@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Recipe
+from services import recipe_images
+
+
+def generate(recipe_id):
+    try:
+        return recipe_id, recipe_images.generate_variants(recipe_id), None
+    except Exception as error:
+        return recipe_id, None, error
+
+
+def generate_in_worker(recipe_id):
+    try:
+        return generate(recipe_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии картинок для уже загруженных рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--force', action='store_true',
+                            help='пересоздать уже готовые копии')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['force']:
+            recipes = recipes.filter(image_variants={})
+        recipe_ids = list(recipes.values_list('pk', flat=True))
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as executor:
+                done = self.report(executor.map(generate_in_worker,
+                                                recipe_ids))
+        else:
+            done = self.report(map(generate, recipe_ids))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {done} из {len(recipe_ids)}'
+        ))
+
+    def report(self, results):
+        done = 0
+        for recipe_id, variants, error in results:
+            if error is not None:
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+            elif variants:
+                done += 1
+        return done
@@ -1,17 +1,122 @@
+import csv
 import json
+import time
+from functools import partial
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from recipes.models import Ingredient
+from services import catalog_cache
+
+CHUNK_SIZE = 64 * 1024
+JSON_SKIP = ' \t\r\n,[]'
+SYNTHETIC_UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    number = 0
+    for chunk in iter(partial(file.read, CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in JSON_SKIP:
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            number += 1
+            try:
+                row = item['name'], item['measurement_unit']
+            except (KeyError, TypeError):
+                raise CommandError(
+                    f'Запись {number}: нужны поля name и measurement_unit'
+                )
+            yield row
+        buffer = buffer[position:]
+    if buffer.strip(JSON_SKIP):
+        raise CommandError('Файл содержит некорректный JSON')
+
+
+def read_csv(file):
+    reader = csv.reader(file)
+    for row in reader:
+        if not row or row == ['name', 'measurement_unit']:
+            continue
+        if len(row) < 2:
+            raise CommandError(
+                f'Строка {reader.line_num}: нужны name и measurement_unit'
+            )
+        yield row[0], row[1]
+
+
+def generate_synthetic(count):
+    for i in range(count):
+        yield (f'синтетический ингредиент {i}',
+               SYNTHETIC_UNITS[i % len(SYNTHETIC_UNITS)])
 
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из JSON или CSV файла пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='ingredients.json')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--format', choices=('json', 'csv'),
+                            help='по умолчанию определяется по расширению')
+        parser.add_argument('--synthetic', type=int, metavar='COUNT',
+                            help='сгенерировать COUNT ингредиентов '
+                                 'вместо чтения файла')
 
     def handle(self, *args, **options):
-        with open('ingredients.json', 'rb') as f:
-            data = json.load(f)
-            for i in data:
-                ingredient = Ingredient()
-                ingredient.name = i['name']
-                ingredient.measurement_unit = i['measurement_unit']
-                ingredient.save()
-                print(i['name'], i['measurement_unit'])
+        if options['synthetic']:
+            self.load(generate_synthetic(options['synthetic']),
+                      options['batch_size'])
+            return
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        readers = {'json': read_json, 'csv': read_csv}
+        if file_format not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path.suffix}')
+        with open(path, encoding='utf-8', newline='') as file:
+            self.load(readers[file_format](file), options['batch_size'])
+
+    def load(self, rows, batch_size):
+        count_before = Ingredient.objects.count()
+        started = time.perf_counter()
+        total = 0
+        batch = []
+        for name, measurement_unit in rows:
+            batch.append(Ingredient(name=name.strip(),
+                                    measurement_unit=measurement_unit.strip()))
+            if len(batch) >= batch_size:
+                total += self.save_batch(batch)
+                batch = []
+                self.report(total, started)
+        if batch:
+            total += self.save_batch(batch)
+            self.report(total, started)
+        catalog_cache.bump_version('ingredients')
+        created = Ingredient.objects.count() - count_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {total}, добавлено ингредиентов: {created}, '
+            f'пропущено дубликатов: {total - created}'
+        ))
+
+    @staticmethod
+    def save_batch(batch):
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
+
+    def report(self, total, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{total} строк за {elapsed:.1f} с '
+            f'({total / elapsed if elapsed else 0:.0f} строк/с)'
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from services import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает списки покупок пользователей из их корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users', help='id пользователя')
+
+    def handle(self, *args, **options):
+        count = shopping_list.rebuild(options['users'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Позиций в списках покупок: {count}')
+        )
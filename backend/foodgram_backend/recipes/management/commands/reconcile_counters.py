@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from services import counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, рецептов и подписчиков '
+            'по данным таблиц')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='только показать расхождения')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            problems = counters.find_inconsistencies()
+            for model_name, field, pk, stored, actual in problems:
+                self.stdout.write(
+                    f'{model_name}={pk} {field}: '
+                    f'в таблице {stored}, должно быть {actual}'
+                )
+            if problems:
+                raise CommandError(f'Расхождений: {len(problems)}')
+            self.stdout.write(self.style.SUCCESS('Счётчики согласованы'))
+            return
+        updated = counters.reconcile()
+        self.stdout.write(
+            self.style.SUCCESS(f'Исправлено счётчиков: {updated}')
+        )
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from services import recipe_scores
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг рецептов для сортировки по популярности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = recipe_scores.refresh(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитан рейтинг {total} рецептов '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
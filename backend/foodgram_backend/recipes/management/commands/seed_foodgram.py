@@ -0,0 +1,134 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from services import (catalog_cache, counters, recipe_scores,
+                      response_cache, shopping_list)
+from users.models import Subscribe, User
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+
+
+def random_pairs(rng, left_ids, right_ids, count, distinct=False):
+    limit = len(left_ids) * len(right_ids)
+    if distinct:
+        limit -= len(set(left_ids) & set(right_ids))
+    count = min(count, limit)
+    pairs = set()
+    while len(pairs) < count:
+        left = rng.choice(left_ids)
+        right = rng.choice(right_ids)
+        if not (distinct and left == right):
+            pairs.add((left, right))
+    return pairs
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--subscriptions', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='зерно генератора для повторяемости')
+        parser.add_argument('--prefix', default='seed',
+                            help='префикс имён, чтобы запускать повторно')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        with transaction.atomic():
+            users = self.step('пользователи', User, [
+                User(username=f'{prefix}_user_{i}',
+                     email=f'{prefix}_user_{i}@example.com',
+                     first_name='Тест', last_name=f'Пользователь {i}',
+                     password=make_password(None))
+                for i in range(options['users'])
+            ])
+            tags = self.step('теги', Tag, [
+                Tag(name=f'{prefix} тег {i}', slug=f'{prefix}-tag-{i}',
+                    color=f'#{self.rng.randrange(0x1000000):06X}')
+                for i in range(options['tags'])
+            ])
+            ingredients = self.step('ингредиенты', Ingredient, [
+                Ingredient(name=f'{prefix} ингредиент {i}',
+                           measurement_unit=UNITS[i % len(UNITS)])
+                for i in range(options['ingredients'])
+            ])
+            recipes = self.step('рецепты', Recipe, [
+                Recipe(author_id=self.rng.choice(users),
+                       name=f'{prefix} рецепт {i}',
+                       text='Синтетический рецепт для замеров',
+                       cooking_time=self.rng.randint(5, 180))
+                for i in range(options['recipes'])
+            ])
+            self.step('теги рецептов', Recipe.tags.through, [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipes
+                for tag_id in self.sample(tags, options['tags_per_recipe'])
+            ])
+            self.step('ингредиенты рецептов', IngredientsInRecipe, [
+                IngredientsInRecipe(recipe_id=recipe_id,
+                                    ingredient_id=ingredient_id,
+                                    amount=self.rng.randint(1, 500))
+                for recipe_id in recipes
+                for ingredient_id in self.sample(
+                    ingredients, options['ingredients_per_recipe']
+                )
+            ])
+            for label, model, field, count in (
+                ('избранное', Favorite, 'recipe_id', options['favorites']),
+                ('корзины', ShoppingCart, 'recipe_id', options['carts']),
+            ):
+                self.step(label, model, [
+                    model(user_id=user_id, **{field: recipe_id})
+                    for user_id, recipe_id in random_pairs(
+                        self.rng, users, recipes, count
+                    )
+                ])
+            self.step('подписки', Subscribe, [
+                Subscribe(user_id=user_id, author_id=author_id)
+                for user_id, author_id in random_pairs(
+                    self.rng, users, users, options['subscriptions'],
+                    distinct=True
+                )
+            ])
+            started = time.perf_counter()
+            counters.reconcile()
+            shopping_list.rebuild()
+            recipe_scores.refresh()
+            self.stdout.write(
+                'Счётчики, списки покупок и рейтинг пересчитаны за '
+                f'{time.perf_counter() - started:.1f} с'
+            )
+        catalog_cache.bump_version('tags')
+        catalog_cache.bump_version('ingredients')
+        response_cache.bump_list()
+        self.stdout.write(self.style.SUCCESS('База заполнена'))
+
+    def sample(self, ids, count):
+        return self.rng.sample(ids, min(count, len(ids)))
+
+    def step(self, label, model, objects):
+        started = time.perf_counter()
+        created = model.objects.bulk_create(objects,
+                                            batch_size=self.batch_size)
+        self.stdout.write(
+            f'{label}: {len(created)} за '
+            f'{time.perf_counter() - started:.1f} с'
+        )
+        return [obj.pk for obj in created]
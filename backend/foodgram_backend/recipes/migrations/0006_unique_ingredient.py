@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Отдельно от слияния дубликатов: в PostgreSQL ограничение нельзя
+    # добавить в транзакции, где остались отложенные триггеры после
+    # изменения строк.
+
+    dependencies = [
+        ('recipes', '0005_merge_duplicate_ingredients'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:36
+
+from django.db import migrations, models
+
+
+def merge_duplicate_recipe_ingredients(apps, schema_editor):
+    IngredientsInRecipe = apps.get_model('recipes', 'IngredientsInRecipe')
+    duplicates = IngredientsInRecipe.objects.values(
+        'recipe_id', 'ingredient_id'
+    ).annotate(
+        keep_id=models.Min('id'),
+        total_amount=models.Sum('amount'),
+        count=models.Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in duplicates:
+        IngredientsInRecipe.objects.filter(pk=group['keep_id']).update(
+            amount=group['total_amount']
+        )
+        IngredientsInRecipe.objects.filter(
+            recipe_id=group['recipe_id'],
+            ingredient_id=group['ingredient_id']
+        ).exclude(pk=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipescore'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.RunPython(
+            merge_duplicate_recipe_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientsinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_in_recipe'),
+        ),
+        # Для tags_mode=all: выборка по tag_id с группировкой по рецепту
+        # читается только из индекса.
+        migrations.RunSQL(
+            'CREATE INDEX recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipe_tags_tag_recipe_idx'
+        ),
+    ]
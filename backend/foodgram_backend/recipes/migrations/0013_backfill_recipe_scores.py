@@ -0,0 +1,29 @@
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def create_missing_scores(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    missing = Recipe.objects.filter(score__isnull=True).values_list(
+        'pk', 'pub_date'
+    ).order_by()
+    batch = []
+    for pk, pub_date in missing.iterator(chunk_size=BATCH_SIZE):
+        batch.append(RecipeScore(recipe_id=pk, updated_at=pub_date))
+        if len(batch) >= BATCH_SIZE:
+            RecipeScore.objects.bulk_create(batch)
+            batch = []
+    RecipeScore.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from services import (catalog_cache, recipe_images, recipe_scores,
+                      response_cache)
+from users.models import User
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    catalog_cache.bump_version('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    catalog_cache.bump_version('tags')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def bump_recipe_response_version(instance, **kwargs):
+    response_cache.bump_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(instance, created, raw, **kwargs):
+    # Выдача по популярности соединяет рецепты с рейтингом через INNER
+    # JOIN, поэтому строка рейтинга нужна каждому рецепту сразу.
+    if created and not raw:
+        recipe_scores.create_for(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image_variants(instance, **kwargs):
+    # Срабатывает и при каскадном удалении рецептов вместе с автором.
+    recipe_images.delete_variants(instance.image_variants)
+
+
+@receiver((post_save, post_delete), sender=IngredientsInRecipe)
+def bump_recipe_ingredients_version(instance, **kwargs):
+    response_cache.bump_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # В post_clear у tag.recipe_set.clear() pk_set пустой, а связей
+        # уже нет, поэтому рецепты запоминаются до очистки.
+        instance._cleared_recipe_ids = list(
+            Recipe.objects.filter(tags=instance).values_list('pk', flat=True)
+        )
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        response_cache.bump_recipes([instance.pk])
+    elif action == 'post_clear':
+        response_cache.bump_recipes(instance.__dict__.pop(
+            '_cleared_recipe_ids', []
+        ))
+    else:
+        response_cache.bump_recipes(pk_set or [])
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(instance, created, update_fields, **kwargs):
+    # Вход обновляет только last_login, ответы рецептов от этого
+    # не меняются.
+    if created or (update_fields and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    response_cache.bump_recipes(
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True)
+    )
@@ -1,20 +1,116 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+
+
 class BuildShoppingCartFileService:
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
 
     def __init__(self, ingredients):
         self.ingredients = ingredients
-        self.final_list = self._build()
+
+    def __iter__(self):
+        return self._chunked(self._build())
 
     def _build(self):
-        final_list = 'Ваш список покупок:\n'
+        yield 'Ваш список покупок:'
 
         for item in self.ingredients:
             ingredient_name = item['ingredient__name']
             measurement_unit = item['ingredient__measurement_unit']
             amount = item['amount']
-            final_list += f'{ingredient_name} ({measurement_unit}) {amount}\n'
+            yield f'\n{ingredient_name} ({measurement_unit}) {amount}'
 
-        return final_list[:-1]
+    @staticmethod
+    def _chunked(parts):
+        chunk = []
+        size = 0
+        for part in parts:
+            chunk.append(part)
+            size += len(part)
+            if size >= CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield ''.join(chunk)
 
     @property
     def filename(self):
-        return 'shopping-list.txt'
+        return f'shopping-list.{self.extension}'
+
+
+class CsvShoppingCartFileService(BuildShoppingCartFileService):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def _build(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+        for item in self.ingredients:
+            writer.writerow((item['ingredient__name'],
+                             item['ingredient__measurement_unit'],
+                             item['amount']))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+class PdfShoppingCartFileService(BuildShoppingCartFileService):
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    font_name = 'ShoppingCartFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    def __iter__(self):
+        # PDF нельзя отдавать по частям: таблица смещений пишется в конце.
+        yield self._render()
+
+    def _render(self):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.pdfgen import canvas
+
+        # Встроенные шрифты PDF без кириллицы, поэтому нужен TTF.
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_CART_PDF_FONT)
+            )
+
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        _, height = A4
+        y = height - self.margin
+        for line in BuildShoppingCartFileService._build(self):
+            if y < self.margin:
+                pdf.showPage()
+                y = height - self.margin
+            pdf.setFont(self.font_name, self.font_size)
+            pdf.drawString(self.margin, y, line.lstrip('\n'))
+            y -= self.line_height
+        pdf.save()
+        return buffer.getvalue()
+
+
+SHOPPING_CART_FILE_SERVICES = {
+    'txt': BuildShoppingCartFileService,
+    'csv': CsvShoppingCartFileService,
+}
+
+try:
+    import reportlab  # noqa: F401
+except ImportError:
+    pass
+else:
+    if os.path.isfile(settings.SHOPPING_CART_PDF_FONT):
+        SHOPPING_CART_FILE_SERVICES['pdf'] = PdfShoppingCartFileService
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _version_key(catalog):
+    return f'catalog:{catalog}:version'
+
+
+def get_version(catalog):
+    cache = get_cache()
+    version = cache.get(_version_key(catalog))
+    if version is None:
+        cache.add(_version_key(catalog), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(catalog))
+    return version
+
+
+def bump_version(catalog):
+    def bump():
+        get_cache().set(_version_key(catalog), time.time_ns(), timeout=None)
+    # Как в response_cache.bump_versions: второй сдвиг после коммита, чтобы
+    # справочник, прочитанный до коммита, не остался под новой версией.
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_or_build(catalog, params, build, name=None):
+    # name задаёт служебную запись справочника: он не совпадает ни с
+    # одним md5 от параметров запроса.
+    suffix = name or hashlib.md5(
+        json.dumps(params, sort_keys=True).encode()
+    ).hexdigest()
+    key = f'catalog:{catalog}:{get_version(catalog)}:{suffix}'
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        content = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+        entry = {
+            'data': data,
+            'etag': hashlib.md5(content.encode()).hexdigest(),
+            'last_modified': int(time.time()),
+        }
+        cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+    return entry
@@ -0,0 +1,73 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Subscribe, User
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(count=Count('pk')).values('count')
+        ),
+        Value(0)
+    )
+
+
+def get_counters():
+    return (
+        (Recipe, 'favorites_count', count_subquery(Favorite, 'recipe')),
+        (User, 'recipes_count', count_subquery(Recipe, 'author')),
+        (User, 'subscribers_count', count_subquery(Subscribe, 'author')),
+    )
+
+
+def change(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def change_favorites(recipe, delta):
+    change(Recipe, recipe.pk, 'favorites_count', delta)
+
+
+def change_favorites_many(recipe_ids, delta):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        favorites_count=F('favorites_count') + delta
+    )
+
+
+def change_recipes(author, delta):
+    change(User, author.pk, 'recipes_count', delta)
+
+
+def change_subscribers(author, delta):
+    change(User, author.pk, 'subscribers_count', delta)
+
+
+def change_subscribers_many(author_ids, delta):
+    User.objects.filter(pk__in=author_ids).update(
+        subscribers_count=F('subscribers_count') + delta
+    )
+
+
+def find_inconsistencies():
+    problems = []
+    for model, field, actual in get_counters():
+        rows = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).values_list('pk', field, 'actual')
+        problems.extend(
+            (model._meta.model_name, field, pk, stored, expected)
+            for pk, stored, expected in rows
+        )
+    return problems
+
+
+def reconcile():
+    updated = 0
+    for model, field, actual in get_counters():
+        updated += model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).update(**{field: actual})
+    return updated
@@ -0,0 +1,92 @@
+import bisect
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+
+from recipes.models import Ingredient
+from services import catalog_cache
+
+
+class IngredientPrefixIndex:
+
+    def __init__(self, rows):
+        self.entries = sorted(
+            (name.lower(), name, measurement_unit, pk)
+            for pk, name, measurement_unit in rows
+        )
+        self.keys = [entry[0] for entry in self.entries]
+
+    def search(self, query, limit):
+        query = query.lower()
+        start = bisect.bisect_left(self.keys, query)
+        found = []
+        for key, *entry in self.entries[start:start + limit]:
+            if not key.startswith(query):
+                break
+            found.append(entry)
+        if len(found) < limit:
+            for key, *entry in self.entries:
+                if query in key and not key.startswith(query):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return [
+            Ingredient(pk=pk, name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit, pk in found
+        ]
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index, _index_version
+    version = catalog_cache.get_version('ingredients')
+    with _index_lock:
+        if _index is None or _index_version != version:
+            _index = IngredientPrefixIndex(
+                Ingredient.objects.values_list(
+                    'pk', 'name', 'measurement_unit'
+                ).iterator()
+            )
+            _index_version = version
+        return _index
+
+
+def search_database(query, limit):
+    return list(
+        Ingredient.objects.filter(name__icontains=query).annotate(
+            rank=Case(
+                When(name__istartswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('rank', 'name')[:limit]
+    )
+
+
+def search_memory(query, limit):
+    return get_index().search(query, limit)
+
+
+BACKENDS = {
+    'database': search_database,
+    'memory': search_memory,
+}
+
+
+def get_backend_name():
+    backend = getattr(settings, 'INGREDIENT_SEARCH_BACKEND', None)
+    if backend:
+        return backend
+    if connection.vendor == 'postgresql':
+        return 'database'
+    return 'memory'
+
+
+def search(query, limit):
+    return BACKENDS[get_backend_name()](query, limit)
@@ -0,0 +1,135 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from services import response_cache
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'recipes/variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_name(image_name, variant, extension):
+    stem = PurePosixPath(image_name).stem
+    return f'{VARIANTS_DIR}/{stem}_{variant}.{extension}'
+
+
+def render_variants(image_file):
+    with Image.open(image_file) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'L'):
+            background = Image.new('RGB', source.size, 'white')
+            background.paste(source.convert('RGBA'),
+                             mask=source.convert('RGBA'))
+            source = background
+        for variant, size in VARIANTS.items():
+            image = source.copy()
+            image.thumbnail(size, Image.LANCZOS)
+            for extension, (image_format, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                # Метаданные (EXIF, ICC) не передаются: сохраняются
+                # только пиксели.
+                image.convert('RGB').save(buffer, image_format, **options)
+                yield variant, extension, buffer.getvalue()
+
+
+def generate_variants(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return None
+    image_name = recipe.image.name
+    variants = {}
+    with default_storage.open(image_name) as image_file:
+        for variant, extension, content in render_variants(image_file):
+            name = get_variant_name(image_name, variant, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants.setdefault(variant, {})[extension] = (
+                default_storage.save(name, ContentFile(content))
+            )
+    if not Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        image_variants=variants
+    ):
+        # Пока готовились копии, картинку заменили или рецепт удалили.
+        delete_files(get_variant_files(variants))
+        return None
+    response_cache.bump_recipes([recipe_id])
+    return variants
+
+
+def get_variant_files(variants):
+    return [
+        name for files in (variants or {}).values() for name in files.values()
+    ]
+
+
+def delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def delete_variants(variants):
+    # Файлы удаляются только после коммита: при откате рецепт продолжает
+    # на них ссылаться.
+    names = get_variant_files(variants)
+    if names:
+        transaction.on_commit(lambda: delete_files(names))
+
+
+def _run_in_worker(recipe_id):
+    try:
+        generate_variants(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать картинку рецепта %s',
+                         recipe_id)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+        return _executor
+
+
+def schedule(recipe_id):
+    if settings.RECIPE_IMAGE_SYNC:
+        return generate_variants(recipe_id)
+    return get_executor().submit(_run_in_worker, recipe_id)
+
+
+def get_variant_urls(recipe, request=None):
+    urls = {}
+    for variant, files in (recipe.image_variants or {}).items():
+        urls[variant] = {}
+        for extension, name in files.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][extension] = url
+    return urls
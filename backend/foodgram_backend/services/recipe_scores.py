@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, RecipeScore, ShoppingCart
+from services import response_cache
+
+SECONDS_IN_DAY = 24 * 60 * 60
+
+
+def count_by_recipe(model):
+    return dict(
+        model.objects.values_list('recipe').annotate(count=Count('pk'))
+        .order_by()
+    )
+
+
+def calculate(favorites_count, shopping_carts_count, age_days):
+    weight = (favorites_count
+              + settings.RECIPE_SCORE_CART_WEIGHT * shopping_carts_count)
+    return weight * 0.5 ** (age_days / settings.RECIPE_SCORE_HALF_LIFE_DAYS)
+
+
+def save_batch(batch):
+    RecipeScore.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['recipe'],
+        update_fields=['score', 'favorites_count', 'shopping_carts_count',
+                       'updated_at']
+    )
+    return len(batch)
+
+
+@transaction.atomic
+def refresh(batch_size=5000):
+    now = timezone.now()
+    favorites = count_by_recipe(Favorite)
+    shopping_carts = count_by_recipe(ShoppingCart)
+    total = 0
+    batch = []
+    for pk, pub_date in Recipe.objects.values_list(
+        'pk', 'pub_date'
+    ).order_by().iterator(chunk_size=batch_size):
+        age_days = max((now - pub_date).total_seconds(), 0) / SECONDS_IN_DAY
+        favorites_count = favorites.get(pk, 0)
+        shopping_carts_count = shopping_carts.get(pk, 0)
+        batch.append(RecipeScore(
+            recipe_id=pk,
+            score=calculate(favorites_count, shopping_carts_count, age_days),
+            favorites_count=favorites_count,
+            shopping_carts_count=shopping_carts_count,
+            updated_at=now
+        ))
+        if len(batch) >= batch_size:
+            total += save_batch(batch)
+            batch = []
+    if batch:
+        total += save_batch(batch)
+    # Порядок выдачи ordering=popular мог измениться.
+    response_cache.bump_list()
+    return total
+
+
+def create_for(recipe):
+    RecipeScore.objects.create(recipe=recipe, updated_at=recipe.pub_date)
+
+
+def order_by_popularity(queryset):
+    # Строку рейтинга каждому рецепту создаёт сигнал post_save, а рецептам
+    # из bulk_create — пересчёт. Фильтр даёт INNER JOIN, и сортировку
+    # обслуживает индекс recipe_score_idx.
+    return queryset.filter(score__isnull=False).order_by(
+        '-score__score', '-id'
+    )
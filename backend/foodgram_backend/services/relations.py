@@ -0,0 +1,39 @@
+from django.db import connection
+
+BATCH_SIZE = 1000
+
+
+def insert_ignore(model, rows, returning, batch_size=BATCH_SIZE):
+    """Вставляет строки через INSERT ... ON CONFLICT DO NOTHING.
+
+    Строки, нарушающие уникальность, база пропускает сама, без ошибки
+    и без предварительной проверки. Возвращает кортежи значений полей
+    returning у действительно добавленных строк.
+    """
+    if not rows:
+        return []
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    quote_name = connection.ops.quote_name
+    row_sql = '({0})'.format(', '.join(['%s'] * len(fields)))
+    sql = (
+        'INSERT INTO {table} ({columns}) VALUES {{values}} '
+        'ON CONFLICT DO NOTHING RETURNING {returning}'
+    ).format(
+        table=quote_name(model._meta.db_table),
+        columns=', '.join(quote_name(field.column) for field in fields),
+        returning=', '.join(
+            quote_name(model._meta.get_field(name).column)
+            for name in returning
+        ),
+    )
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                sql.format(values=', '.join([row_sql] * len(batch))),
+                [field.get_db_prep_save(row[field.name], connection)
+                 for row in batch for field in fields]
+            )
+            inserted.extend(cursor.fetchall())
+    return inserted
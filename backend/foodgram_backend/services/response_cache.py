@@ -0,0 +1,108 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from services import catalog_cache
+
+LIST_SCOPE = 'list'
+PREFIX = 'recipe-response'
+
+
+def get_cache():
+    return caches[settings.RECIPE_RESPONSE_CACHE_ALIAS]
+
+
+def get_recipe_scope(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def _version_key(scope):
+    return f'{PREFIX}:{scope}:version'
+
+
+def get_versions(scopes):
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(scopes):
+    def bump():
+        get_cache().set_many(
+            {_version_key(scope): time.time_ns() for scope in scopes},
+            timeout=None
+        )
+    # Первый сдвиг сразу, второй после коммита: иначе запрос между ними
+    # мог бы закешировать ещё не изменённые данные под новой версией.
+    bump()
+    transaction.on_commit(bump)
+
+
+def bump_recipes(recipe_ids):
+    bump_versions(
+        [LIST_SCOPE] + [get_recipe_scope(pk) for pk in recipe_ids]
+    )
+
+
+def bump_list():
+    bump_versions([LIST_SCOPE])
+
+
+def get_key(scope, params):
+    # Ответ содержит теги и ингредиенты, поэтому в ключ входят и версии
+    # их справочников.
+    versions = get_versions([scope]) + [
+        catalog_cache.get_version('tags'),
+        catalog_cache.get_version('ingredients'),
+    ]
+    digest = hashlib.md5(
+        json.dumps([versions, params], sort_keys=True).encode()
+    ).hexdigest()
+    return f'{PREFIX}:{scope}:{digest}'
+
+
+def get_data(key):
+    data = get_cache().get(key)
+    _count('hits' if data is not None else 'misses')
+    return data
+
+
+def set_data(key, data):
+    get_cache().set(key, data, settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+
+
+def _count(name):
+    cache = get_cache()
+    key = f'{PREFIX}:stats:{name}'
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Ключ вытеснили между add и incr, одно попадание не важно.
+            pass
+
+
+def get_stats():
+    cache = get_cache()
+    stats = {
+        name: cache.get(f'{PREFIX}:stats:{name}', 0)
+        for name in ('hits', 'misses')
+    }
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0
+    return stats
+
+
+def reset_stats():
+    get_cache().delete_many(
+        [f'{PREFIX}:stats:{name}' for name in ('hits', 'misses')]
+    )
@@ -0,0 +1,195 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import IngredientsInRecipe, ShoppingCart, ShoppingListItem
+from services import relations
+
+BATCH_SIZE = 1000
+
+
+def get_recipe_amounts(recipe):
+    return dict(
+        IngredientsInRecipe.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def get_expected_items(user_ids=None):
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+    rows = IngredientsInRecipe.objects.filter(
+        recipe__recipe_in_shopping_cart__in=carts
+    ).values(
+        'recipe__recipe_in_shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total_amount=Sum('amount')).order_by()
+    return {
+        (row['recipe__recipe_in_shopping_cart__user_id'],
+         row['ingredient_id']): row['total_amount']
+        for row in rows
+    }
+
+
+@transaction.atomic
+def apply_changes(changes):
+    # Строки вставляются и блокируются в порядке (user_id, ingredient_id):
+    # два запроса с пересекающимися позициями ждут друг друга, а не
+    # попадают во взаимную блокировку.
+    changes = {key: delta for key, delta in sorted(changes.items()) if delta}
+    if not changes:
+        return
+    # Новые позиции вставляются сразу. Если позиция уже есть или её
+    # параллельно создал другой запрос, база её пропустит, и количество
+    # изменится ниже, под блокировкой строки.
+    created = relations.insert_ignore(ShoppingListItem, [
+        {'user': user_id, 'ingredient': ingredient_id, 'total_amount': delta}
+        for (user_id, ingredient_id), delta in changes.items() if delta > 0
+    ], returning=['user', 'ingredient'], batch_size=BATCH_SIZE)
+    for key in created:
+        del changes[key]
+    if not changes:
+        return
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in changes},
+            ingredient_id__in={ingredient_id for _, ingredient_id in changes}
+        ).order_by('user_id', 'ingredient_id')
+    }
+    to_update = []
+    to_delete = []
+    for (user_id, ingredient_id), delta in changes.items():
+        item = items.get((user_id, ingredient_id))
+        if item is None:
+            continue
+        item.total_amount += delta
+        if item.total_amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_update(
+        to_update, ['total_amount'], batch_size=BATCH_SIZE
+    )
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def add_recipe(user, recipe):
+    apply_changes({
+        (user.pk, ingredient_id): amount
+        for ingredient_id, amount in get_recipe_amounts(recipe).items()
+    })
+
+
+def remove_recipe(user, recipe):
+    apply_changes({
+        (user.pk, ingredient_id): -amount
+        for ingredient_id, amount in get_recipe_amounts(recipe).items()
+    })
+
+
+def get_total_amounts(recipe_ids):
+    return dict(
+        IngredientsInRecipe.objects.filter(recipe_id__in=recipe_ids).values(
+            'ingredient_id'
+        ).annotate(total_amount=Sum('amount')).order_by().values_list(
+            'ingredient_id', 'total_amount'
+        )
+    )
+
+
+def add_recipes(user, recipe_ids):
+    apply_changes({
+        (user.pk, ingredient_id): amount
+        for ingredient_id, amount in get_total_amounts(recipe_ids).items()
+    })
+
+
+def remove_recipes(user, recipe_ids):
+    apply_changes({
+        (user.pk, ingredient_id): -amount
+        for ingredient_id, amount in get_total_amounts(recipe_ids).items()
+    })
+
+
+def clear(user):
+    ShoppingListItem.objects.filter(user=user).delete()
+
+
+def update_recipe(recipe, old_amounts, new_amounts=None):
+    if new_amounts is None:
+        new_amounts = get_recipe_amounts(recipe)
+    deltas = {
+        ingredient_id: (new_amounts.get(ingredient_id, 0)
+                        - old_amounts.get(ingredient_id, 0))
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    user_ids = ShoppingCart.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True
+    )
+    apply_changes({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in deltas.items()
+    })
+
+
+def delete_recipe(recipe):
+    amounts = get_recipe_amounts(recipe)
+    user_ids = ShoppingCart.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True
+    )
+    apply_changes({
+        (user_id, ingredient_id): -amount
+        for user_id in user_ids
+        for ingredient_id, amount in amounts.items()
+    })
+
+
+def delete_recipes(recipes):
+    rows = IngredientsInRecipe.objects.filter(
+        recipe__in=recipes, recipe__recipe_in_shopping_cart__isnull=False
+    ).values(
+        'recipe__recipe_in_shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total_amount=Sum('amount')).order_by()
+    apply_changes({
+        (row['recipe__recipe_in_shopping_cart__user_id'],
+         row['ingredient_id']): -row['total_amount']
+        for row in rows
+    })
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    items.delete()
+    expected = get_expected_items(user_ids)
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          total_amount=total_amount)
+         for (user_id, ingredient_id), total_amount in expected.items()],
+        batch_size=BATCH_SIZE
+    )
+    return len(expected)
+
+
+def find_inconsistencies(user_ids=None):
+    expected = get_expected_items(user_ids)
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    actual = {
+        (user_id, ingredient_id): total_amount
+        for user_id, ingredient_id, total_amount in items.values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        )
+    }
+    return [
+        (user_id, ingredient_id, expected.get((user_id, ingredient_id), 0),
+         actual.get((user_id, ingredient_id), 0))
+        for user_id, ingredient_id in sorted(expected.keys() | actual.keys())
+        if expected.get((user_id, ingredient_id), 0)
+        != actual.get((user_id, ingredient_id), 0)
+    ]
@@ -0,0 +1,58 @@
+from django.db.models import F
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscribe, User
+
+
+def get_version(user):
+    # Читаем из БД, а не из request.user: объект мог прийти из кеша
+    # токенов и устареть.
+    return User.objects.filter(pk=user.pk).values_list(
+        'state_version', flat=True
+    ).get()
+
+
+def bump_versions(user_ids):
+    User.objects.filter(pk__in=user_ids).update(
+        state_version=F('state_version') + 1
+    )
+
+
+def bump_version(user):
+    bump_versions([user.pk])
+
+
+def get_recipe_user_ids(recipes):
+    """Пользователи, у которых рецепты в избранном или в корзине."""
+    return set(
+        Favorite.objects.filter(recipe__in=recipes).values_list('user_id',
+                                                                flat=True)
+    ).union(
+        ShoppingCart.objects.filter(recipe__in=recipes).values_list(
+            'user_id', flat=True
+        )
+    )
+
+
+def get_subscriber_ids(author):
+    return list(
+        Subscribe.objects.filter(author=author).values_list('user_id',
+                                                            flat=True)
+    )
+
+
+def get_state(user):
+    return {
+        'favorites': list(
+            Favorite.objects.filter(user=user).order_by('recipe_id')
+            .values_list('recipe_id', flat=True)
+        ),
+        'shopping_cart': list(
+            ShoppingCart.objects.filter(user=user).order_by('recipe_id')
+            .values_list('recipe_id', flat=True)
+        ),
+        'subscriptions': list(
+            Subscribe.objects.filter(user=user).order_by('author_id')
+            .values_list('author_id', flat=True)
+        ),
+    }
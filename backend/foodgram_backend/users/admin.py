@@ -12,6 +12,8 @@ class UserAdmin(admin.ModelAdmin):
         'password',
         'first_name',
         'last_name',
+        'recipes_count',
+        'subscribers_count',
     )
     list_filter = ('username', 'email')
     search_fields = ('username',)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='state_version',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Версия избранного, корзины и подписок'),
+        ),
+    ]
@@ -3,11 +3,28 @@ from django.db import models
 
 
 class User(AbstractUser):
+    COUNTER_FIELDS = ('recipes_count', 'subscribers_count', 'state_version')
+
     email = models.EmailField(
         verbose_name='Электронная почта',
         max_length=254,
         unique=True
     )
+    recipes_count = models.IntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.IntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
+    state_version = models.IntegerField(
+        verbose_name='Версия избранного, корзины и подписок',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ['id']
@@ -21,6 +38,21 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        # Счётчики меняются только через F() (services.counters,
+        # services.user_state), поэтому save() устаревшего объекта,
+        # например request.user, их не перезаписывает.
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
 
 class Subscribe(models.Model):
     user = models.ForeignKey(